@@ -1,12 +1,37 @@
+import time
+SCRIPT_START = time.perf_counter()
+
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime
 import re
 import io
 import hashlib
-import requests
-from urllib.parse import urlparse
+from urllib.parse import urlparse, quote, unquote
 import json
+import uuid
+import asyncio
+import os
+import sys
+import hmac
+import secrets
+import threading
+import heapq
+import html
+import zipfile
+import subprocess
+import statistics
+from collections import OrderedDict, namedtuple
+from difflib import SequenceMatcher
+from importlib.util import find_spec
+from string import Template
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+# requests y openpyxl se importan solo al usarlos (Google Sheets / Excel)
+
+IMPORTS_DONE = time.perf_counter()
 
 # Configuración de la página
 st.set_page_config(
@@ -18,33 +43,165 @@ st.set_page_config(
 
 # ============== CONFIGURACIÓN ==============
 
-def hash_password(password):
-    """Hashea la contraseña para almacenamiento seguro"""
-    return hashlib.sha256(password.encode()).hexdigest()
+# Almacén de usuarios compartido entre sesiones
+USERS_FILE = os.environ.get("NADADORES_USERS_FILE", "usuarios.json")
+
+# Coste del hash de contraseñas (iteraciones PBKDF2-SHA256)
+PASSWORD_HASH_ITERATIONS = 600_000
+
+# Duración de la sesión firmada (segundos)
+SESSION_TOKEN_TTL = 12 * 3600
+
+# Permisos por rol (conjuntos precompilados)
+ROLES = ["admin", "entrenador", "asistente"]
+ROLE_PERMISSIONS = {
+    'admin': frozenset(['view', 'edit', 'delete', 'upload', 'download', 'convert', 'user_management']),
+    'entrenador': frozenset(['view', 'edit', 'upload', 'download', 'convert']),
+    'asistente': frozenset(['view'])
+}
+
+def hash_password(password, iterations=PASSWORD_HASH_ITERATIONS):
+    """Hashea la contraseña con sal (PBKDF2-SHA256) para almacenamiento seguro"""
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+def verify_password(password, stored):
+    """Comprueba una contraseña contra su hash (acepta el SHA-256 antiguo sin sal)"""
+    if stored.startswith("pbkdf2_sha256$"):
+        _, iterations, salt, expected = stored.split("$")
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode(), bytes.fromhex(salt), int(iterations))
+        return hmac.compare_digest(digest.hex(), expected)
+    return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+
+def needs_rehash(stored):
+    """True si el hash es antiguo o tiene un coste distinto al configurado"""
+    return not stored.startswith(f"pbkdf2_sha256${PASSWORD_HASH_ITERATIONS}$")
 
 # USUARIOS Y PERMISOS - Inicialización
-def initialize_users():
-    if 'users_data' not in st.session_state:
-        st.session_state.users_data = {
-            "admin": {
-                "password": hash_password("admin123"),
-                "role": "admin",
-                "name": "Administrador Principal",
-                "active": True
-            },
-            "entrenador": {
-                "password": hash_password("entrenador123"),
-                "role": "entrenador", 
-                "name": "Entrenador Principal",
-                "active": True
-            },
-            "asistente": {
-                "password": hash_password("asistente123"),
-                "role": "asistente",
-                "name": "Asistente",
-                "active": True
-            }
+def default_users():
+    return {
+        "admin": {
+            "password": hash_password("admin123"),
+            "role": "admin",
+            "name": "Administrador Principal",
+            "active": True
+        },
+        "entrenador": {
+            "password": hash_password("entrenador123"),
+            "role": "entrenador", 
+            "name": "Entrenador Principal",
+            "active": True
+        },
+        "asistente": {
+            "password": hash_password("asistente123"),
+            "role": "asistente",
+            "name": "Asistente",
+            "active": True
         }
+    }
+
+class UserStore:
+    """Usuarios persistidos en disco y compartidos por todas las sesiones.
+
+    Las lecturas no bloquean: cada modificación sustituye el diccionario
+    completo (copia al escribir) bajo un lock y lo guarda de forma atómica.
+    Cada usuario lleva un contador `rev` que invalida sus sesiones firmadas
+    cuando cambian su contraseña, rol o estado.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            self.secret = data['secret']
+            self.users = data['users']
+        else:
+            self.secret = secrets.token_hex(32)
+            self.users = default_users()
+            self._save()
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'secret': self.secret, 'users': self.users}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _update(self, username, changes=None, delete=False):
+        with self.lock:
+            users = dict(self.users)
+            if delete:
+                users.pop(username, None)
+            else:
+                user = dict(users.get(username, {}))
+                user.update(changes)
+                user['rev'] = user.get('rev', 0) + 1
+                users[username] = user
+            self.users = users
+            self._save()
+
+    def get(self, username):
+        return self.users.get(username)
+
+    def authenticate(self, username, password):
+        """Valida credenciales; devuelve (usuario, mensaje de error)"""
+        user = self.users.get(username)
+        if user is None:
+            return None, "❌ Usuario no encontrado"
+        if not user.get('active', True):
+            return None, "❌ Usuario desactivado"
+        if not verify_password(password, user["password"]):
+            return None, "❌ Contraseña incorrecta"
+        if needs_rehash(user["password"]):
+            self._update(username, {"password": hash_password(password)})
+            user = self.users[username]
+        return user, ""
+
+    def set_password(self, username, password):
+        self._update(username, {"password": hash_password(password)})
+
+    def create_user(self, username, name, role, active, password):
+        self._update(username, {
+            "password": hash_password(password),
+            "role": role,
+            "name": name,
+            "active": active
+        })
+
+    def update_user(self, username, name, role, active):
+        self._update(username, {"name": name, "role": role, "active": active})
+
+    def delete_user(self, username):
+        self._update(username, delete=True)
+
+@st.cache_resource
+def get_user_store():
+    """Almacén de usuarios único para todo el servidor"""
+    return UserStore(USERS_FILE)
+
+def sign_session(store, username):
+    """Token de sesión firmado: usuario|rev|caducidad|firma"""
+    user = store.get(username)
+    payload = f"{username}|{user.get('rev', 0)}|{int(time.time()) + SESSION_TOKEN_TTL}"
+    signature = hmac.new(store.secret.encode(), payload.encode(), hashlib.sha256).hexdigest()
+    return f"{payload}|{signature}"
+
+def verify_session(store, token):
+    """Comprueba el token de la sesión; devuelve el usuario o None"""
+    try:
+        username, rev, expires, signature = token.rsplit("|", 3)
+    except (AttributeError, ValueError):
+        return None
+    payload = f"{username}|{rev}|{expires}"
+    expected = hmac.new(store.secret.encode(), payload.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(signature, expected) or int(expires) < time.time():
+        return None
+    user = store.get(username)
+    if user is None or not user.get('active', True) or str(user.get('rev', 0)) != rev:
+        return None
+    return user
 
 # TABLA DE CONVERSIÓN DE TIEMPOS
 CONVERSION_DATA = {
@@ -67,16 +224,34 @@ PRUEBAS = [
     "100m Estilos", "200m Estilos"
 ]
 
+# Columna con el identificador estable de cada nadador
+ID_COL = "IdNadador"
+
+# Dataset Parquet con una partición por temporada (temporada=<hoja>/part-0.parquet)
+PARQUET_DIR = os.environ.get("NADADORES_PARQUET_DIR", "datos_parquet")
+
+# Columnas que necesita la vista de lista (lectura proyectada)
+LIST_COLUMNS = [ID_COL, 'Nombre', 'Sexo', 'AñoNacimiento', 'Disponible']
+
 # ============== AUTENTICACIÓN Y GESTIÓN DE USUARIOS ==============
 
+SESSION_KEYS = ['authenticated', 'auth_token', 'username', 'user_role', 'user_name']
+
 def check_authentication():
-    """Sistema de autenticación"""
-    initialize_users()
+    """Sistema de autenticación (en cada rerun solo se valida la firma del token)"""
+    store = get_user_store()
     
-    if 'authenticated' not in st.session_state:
-        st.session_state.authenticated = False
+    user = verify_session(store, st.session_state.get('auth_token'))
+    if user is None:
+        for key in SESSION_KEYS:
+            if key in st.session_state:
+                del st.session_state[key]
+    else:
+        st.session_state.authenticated = True
+        st.session_state.user_role = user["role"]
+        st.session_state.user_name = user["name"]
     
-    if not st.session_state.authenticated:
+    if not st.session_state.get('authenticated', False):
         show_login()
         return False
     else:
@@ -96,25 +271,18 @@ def show_login():
         password = st.text_input("🔑 Contraseña", type="password")
         
         if st.button("🚀 Entrar", type="primary"):
-            users = st.session_state.users_data
-            if username in users and users[username].get('active', True):
-                hashed_password = hash_password(password)
-                if hashed_password == users[username]["password"]:
-                    st.session_state.authenticated = True
-                    st.session_state.username = username
-                    st.session_state.user_role = users[username]["role"]
-                    st.session_state.user_name = users[username]["name"]
-                    st.success("✅ Acceso correcto")
-                    st.rerun()
-                else:
-                    st.error("❌ Contraseña incorrecta")
-            elif username in users and not users[username].get('active', True):
-                st.error("❌ Usuario desactivado")
+            store = get_user_store()
+            user, error = store.authenticate(username, password)
+            if user is not None:
+                st.session_state.auth_token = sign_session(store, username)
+                st.session_state.username = username
+                st.success("✅ Acceso correcto")
+                st.rerun()
             else:
-                st.error("❌ Usuario no encontrado")
+                st.error(error)
     
     with st.expander("👥 Usuarios del Sistema"):
-        users = st.session_state.users_data
+        users = get_user_store().users
         for username, user_data in users.items():
             if user_data.get('active', True):
                 st.markdown(f"""
@@ -132,7 +300,8 @@ def show_user_info():
         st.info(f"{icon} **{st.session_state.user_role.title()}**")
         
         if st.button("🚪 Cerrar Sesión"):
-            for key in ['authenticated', 'username', 'user_role', 'user_name']:
+            stop_sync_worker()
+            for key in SESSION_KEYS:
                 if key in st.session_state:
                     del st.session_state[key]
             st.rerun()
@@ -142,15 +311,7 @@ def has_permission(action):
     if not st.session_state.get('authenticated', False):
         return False
     
-    role = st.session_state.get('user_role', 'asistente')
-    
-    permissions = {
-        'admin': ['view', 'edit', 'delete', 'upload', 'download', 'convert', 'user_management'],
-        'entrenador': ['view', 'edit', 'upload', 'download', 'convert'],
-        'asistente': ['view']
-    }
-    
-    return action in permissions.get(role, [])
+    return action in ROLE_PERMISSIONS.get(st.session_state.get('user_role', 'asistente'), ())
 
 def show_user_management():
     """Panel de gestión de usuarios (solo admin)"""
@@ -159,11 +320,12 @@ def show_user_management():
         return
     
     st.header("👥 Gestión de Usuarios")
+    store = get_user_store()
     
     # Lista de usuarios actuales
     st.subheader("📋 Usuarios Actuales")
     users_df = []
-    for username, user_data in st.session_state.users_data.items():
+    for username, user_data in store.users.items():
         users_df.append({
             'Usuario': username,
             'Nombre': user_data['name'],
@@ -184,7 +346,7 @@ def show_user_management():
             col1, col2 = st.columns(2)
             
             with col1:
-                target_user = st.selectbox("Usuario", list(st.session_state.users_data.keys()))
+                target_user = st.selectbox("Usuario", list(store.users.keys()))
                 new_password = st.text_input("Nueva Contraseña", type="password")
             
             with col2:
@@ -195,7 +357,9 @@ def show_user_management():
             if st.form_submit_button("🔄 Cambiar Contraseña", type="primary"):
                 if new_password and new_password == confirm_password:
                     if len(new_password) >= 6:
-                        st.session_state.users_data[target_user]["password"] = hash_password(new_password)
+                        store.set_password(target_user, new_password)
+                        if target_user == st.session_state.get('username'):
+                            st.session_state.auth_token = sign_session(store, target_user)
                         st.success(f"✅ Contraseña cambiada para {target_user}")
                         st.rerun()
                     else:
@@ -212,7 +376,7 @@ def show_user_management():
             with col1:
                 new_username = st.text_input("Nombre de Usuario")
                 new_name = st.text_input("Nombre Completo")
-                new_role = st.selectbox("Rol", ["admin", "entrenador", "asistente"])
+                new_role = st.selectbox("Rol", ROLES)
             
             with col2:
                 new_pass = st.text_input("Contraseña", type="password")
@@ -221,14 +385,9 @@ def show_user_management():
             
             if st.form_submit_button("➕ Crear Usuario", type="primary"):
                 if new_username and new_name and new_pass:
-                    if new_username not in st.session_state.users_data:
+                    if store.get(new_username) is None:
                         if new_pass == confirm_new_pass and len(new_pass) >= 6:
-                            st.session_state.users_data[new_username] = {
-                                "password": hash_password(new_pass),
-                                "role": new_role,
-                                "name": new_name,
-                                "active": new_active
-                            }
+                            store.create_user(new_username, new_name, new_role, new_active, new_pass)
                             st.success(f"✅ Usuario {new_username} creado exitosamente")
                             st.rerun()
                         else:
@@ -245,12 +404,11 @@ def show_user_management():
             col1, col2 = st.columns(2)
             
             with col1:
-                modify_user = st.selectbox("Seleccionar Usuario", list(st.session_state.users_data.keys()))
+                modify_user = st.selectbox("Seleccionar Usuario", list(store.users.keys()))
                 if modify_user:
-                    current_data = st.session_state.users_data[modify_user]
+                    current_data = store.get(modify_user)
                     modify_name = st.text_input("Nombre Completo", value=current_data['name'])
-                    modify_role = st.selectbox("Rol", ["admin", "entrenador", "asistente"], 
-                                             index=["admin", "entrenador", "asistente"].index(current_data['role']))
+                    modify_role = st.selectbox("Rol", ROLES, index=ROLES.index(current_data['role']))
             
             with col2:
                 if modify_user:
@@ -262,9 +420,9 @@ def show_user_management():
             with col_update:
                 if st.form_submit_button("💾 Actualizar Usuario", type="primary"):
                     if modify_user and modify_name:
-                        st.session_state.users_data[modify_user]["name"] = modify_name
-                        st.session_state.users_data[modify_user]["role"] = modify_role
-                        st.session_state.users_data[modify_user]["active"] = modify_active
+                        store.update_user(modify_user, modify_name, modify_role, modify_active)
+                        if modify_user == st.session_state.get('username'):
+                            st.session_state.auth_token = sign_session(store, modify_user)
                         st.success(f"✅ Usuario {modify_user} actualizado")
                         st.rerun()
                     else:
@@ -274,7 +432,7 @@ def show_user_management():
                 if st.form_submit_button("🗑️ Eliminar", type="secondary"):
                     if modify_user != "admin":  # Proteger cuenta admin principal
                         if st.session_state.get('confirm_user_delete', '') == modify_user:
-                            del st.session_state.users_data[modify_user]
+                            store.delete_user(modify_user)
                             st.success(f"✅ Usuario {modify_user} eliminado")
                             st.rerun()
                         else:
@@ -285,36 +443,122 @@ def show_user_management():
 
 # ============== GESTIÓN DE DATOS ==============
 
-def load_google_sheets(url):
+# Servidor de exportación de Google Sheets (configurable solo para pruebas con un servidor local)
+SHEETS_EXPORT_BASE = os.environ.get("NADADORES_SHEETS_EXPORT_BASE", "https://docs.google.com")
+
+def sheets_export_url(url):
+    """URL de descarga xlsx de una hoja de Google; cualquier otra URL se rechaza"""
+    parsed = urlparse(str(url).strip())
+    match = re.match(r'/spreadsheets/d/([\w-]+)', parsed.path)
+    if parsed.scheme not in ('http', 'https') or parsed.hostname != 'docs.google.com' or not match:
+        raise Exception("URL no válida de Google Sheets")
+    return f"{SHEETS_EXPORT_BASE}/spreadsheets/d/{match.group(1)}/export?format=xlsx"
+
+def download_bytes(url):
+    """Descarga una URL con requests"""
+    import requests
+    
+    response = requests.get(url, timeout=30)
+    if response.status_code == 200:
+        return response.content
+    raise Exception(f"Error al acceder a Google Sheets: {response.status_code}")
+
+def fetch_sheet_bytes(url, fetch=None):
+    """Descarga el libro xlsx de una hoja de Google (`fetch(url)` sustituye la descarga en pruebas)"""
+    return (fetch or download_bytes)(sheets_export_url(url))
+
+def load_google_sheets(url, fetch=None):
     """Cargar datos desde Google Sheets"""
     try:
-        if 'docs.google.com/spreadsheets' in url:
-            doc_id = url.split('/d/')[1].split('/')[0]
-            csv_url = f"https://docs.google.com/spreadsheets/d/{doc_id}/export?format=xlsx"
-            
-            response = requests.get(csv_url)
-            if response.status_code == 200:
-                return pd.ExcelFile(io.BytesIO(response.content))
-            else:
-                raise Exception(f"Error al acceder a Google Sheets: {response.status_code}")
-        else:
-            raise Exception("URL no válida de Google Sheets")
+        return pd.ExcelFile(io.BytesIO(fetch_sheet_bytes(url, fetch)))
     except Exception as e:
         raise Exception(f"Error al cargar Google Sheets: {str(e)}")
 
+class ParquetSeasonSource:
+    """Temporadas guardadas como dataset Parquet (una partición por temporada)"""
+    
+    is_parquet = True
+    
+    def __init__(self, path):
+        self.path = path
+        self.sheet_names = sorted(
+            unquote(name.split('=', 1)[1])
+            for name in os.listdir(path)
+            if name.startswith('temporada=') and os.path.exists(self.season_file(unquote(name.split('=', 1)[1])))
+        )
+    
+    def season_file(self, sheet):
+        return os.path.join(self.path, f"temporada={quote(sheet, safe='')}", "part-0.parquet")
+    
+    def read(self, sheet, columns=None):
+        """Lee una temporada con memory-map, solo con las columnas pedidas"""
+        path = self.season_file(sheet)
+        if columns is not None:
+            available = set(pq.read_schema(path).names)
+            columns = [col for col in columns if col in available]
+        return pq.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+def read_season(source, sheet, columns=None):
+    """Lee una temporada de cualquier fuente (Excel/Google Sheets o Parquet)"""
+    if getattr(source, 'is_parquet', False):
+        return source.read(sheet, columns)
+    df = pd.read_excel(source, sheet_name=sheet)
+    return df if columns is None else df[[col for col in columns if col in df.columns]]
+
+def prepare_for_parquet(df):
+    """Unifica columnas con tipos mezclados (p.ej. fechas y texto) para Arrow"""
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype == object:
+            values = df[col].dropna()
+            if values.map(type).nunique() > 1:
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+def compile_to_parquet(excel_file, path=PARQUET_DIR):
+    """Convierte todas las hojas del Excel en particiones Parquet; devuelve el nº de temporadas"""
+    for sheet in excel_file.sheet_names:
+        df = assign_swimmer_ids(pd.read_excel(excel_file, sheet_name=sheet))
+        season_dir = os.path.join(path, f"temporada={quote(sheet, safe='')}")
+        os.makedirs(season_dir, exist_ok=True)
+        table = pa.Table.from_pandas(prepare_for_parquet(df), preserve_index=False)
+        tmp_path = os.path.join(season_dir, "part-0.parquet.tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(season_dir, "part-0.parquet"))
+    return len(excel_file.sheet_names)
+
+def show_compile_button(excel_file):
+    """Botón para compilar la fuente Excel/Sheets al formato Parquet"""
+    if excel_file is None or not has_permission('upload'):
+        return
+    if st.button("⚡ Compilar a Parquet", help="Las próximas cargas leerán el dataset Parquet en milisegundos"):
+        with st.spinner("Compilando temporadas a Parquet..."):
+            try:
+                count = compile_to_parquet(excel_file)
+                st.success(f"✅ {count} temporadas compiladas en '{PARQUET_DIR}'")
+            except Exception as e:
+                st.error(f"❌ Error al compilar: {str(e)}")
+
 def load_data_source():
     """Gestión unificada de fuentes de datos"""
     st.header("📊 Fuente de Datos")
     
     source_type = st.radio(
         "Selecciona la fuente de datos:",
-        ["📁 Archivo Local", "🌐 Google Sheets Online"],
+        ["📁 Archivo Local", "🌐 Google Sheets Online", "🗂️ Parquet (rápido)"],
         horizontal=True
     )
     
     excel_file = None
     
-    if source_type == "📁 Archivo Local":
+    if source_type == "🗂️ Parquet (rápido)":
+        if os.path.isdir(PARQUET_DIR):
+            excel_file = ParquetSeasonSource(PARQUET_DIR)
+        if excel_file is None or not excel_file.sheet_names:
+            excel_file = None
+            st.info("ℹ️ No hay temporadas en Parquet. Carga un Excel o Google Sheets y pulsa **⚡ Compilar a Parquet**")
+    
+    elif source_type == "📁 Archivo Local":
         uploaded_file = st.file_uploader(
             "Selecciona archivo Excel",
             type=['xlsx', 'xls'],
@@ -322,6 +566,7 @@ def load_data_source():
         )
         if uploaded_file:
             excel_file = pd.ExcelFile(uploaded_file)
+            show_compile_button(excel_file)
             
     else:  # Google Sheets
         if has_permission('upload'):
@@ -342,6 +587,7 @@ def load_data_source():
                     try:
                         excel_file = load_google_sheets(sheets_url)
                         st.session_state.sheets_url = sheets_url
+                        st.session_state.sheets_excel = excel_file
                         st.success("✅ Conectado exitosamente con Google Sheets")
                     except Exception as e:
                         st.error(f"❌ Error: {str(e)}")
@@ -350,46 +596,777 @@ def load_data_source():
                 with st.spinner("Actualizando datos..."):
                     try:
                         excel_file = load_google_sheets(st.session_state.sheets_url)
-                        st.success("✅ Datos actualizados desde Google Sheets")
+                        st.session_state.sheets_excel = excel_file
+                        log = get_season_log()
+                        if log is not None and st.session_state.get('season_sheets_url') == st.session_state.sheets_url:
+                            # Solo se aplican las diferencias; las ediciones locales se conservan
+                            diff = sync_now(log, excel_file, st.session_state.get('current_sheet'))
+                            st.success(f"✅ {len(diff['changed'])} modificados, {len(diff['added'])} altas, "
+                                       f"{len(diff['removed'])} bajas")
+                        else:
+                            st.success("✅ Datos actualizados desde Google Sheets")
                     except Exception as e:
                         st.error(f"❌ Error al actualizar: {str(e)}")
+            
+            # Mantener el libro descargado entre reruns
+            if excel_file is None:
+                excel_file = st.session_state.get('sheets_excel')
+            show_compile_button(excel_file)
         else:
             st.warning("⚠️ Sin permisos para conectar fuentes externas")
     
     return excel_file
 
+# ============== HISTORIAL DE CAMBIOS ==============
+
+def new_swimmer_id(existing):
+    """Genera un IdNadador corto que no esté en `existing`"""
+    while True:
+        swimmer_id = uuid.uuid4().hex[:8].upper()
+        if swimmer_id not in existing:
+            return swimmer_id
+
+def assign_swimmer_ids(df):
+    """Asigna un IdNadador estable a cada fila, respetando los ya guardados en la hoja"""
+    df = df.reset_index(drop=True)
+    if ID_COL in df.columns:
+        raw = [str(x).strip() if pd.notna(x) else '' for x in df[ID_COL]]
+    else:
+        raw = [''] * len(df)
+
+    existing = set(x for x in raw if x)
+    seen = set()
+    ids = []
+    for swimmer_id in raw:
+        # Vacíos o duplicados reciben un identificador nuevo
+        if not swimmer_id or swimmer_id in seen:
+            swimmer_id = new_swimmer_id(existing)
+            existing.add(swimmer_id)
+        seen.add(swimmer_id)
+        ids.append(swimmer_id)
+
+    if ID_COL in df.columns:
+        df[ID_COL] = ids
+    else:
+        df.insert(0, ID_COL, ids)
+    return df
+
+class SeasonEditLog:
+    """Registro de cambios sobre la temporada cargada con deshacer/rehacer.
+
+    La hoja original nunca se modifica: los cambios se guardan en un registro
+    que solo crece y la vista se reconstruye aplicando una capa (overlay) con
+    las celdas modificadas y las filas eliminadas. Cada cambio incrementa
+    `version`, de modo que exportaciones y cachés usan `key` en lugar de
+    comparar o copiar DataFrames completos.
+    """
+
+    def __init__(self, base_df):
+        self.id = uuid.uuid4().hex
+        self.base = assign_swimmer_ids(base_df)
+        # Índice hash IdNadador → etiqueta de fila (búsquedas O(1))
+        self.index = {swimmer_id: label for label, swimmer_id in enumerate(self.base[ID_COL])}
+        self.entries = []   # Registro completo (nunca se borra)
+        self.applied = []   # Índices de entries activos, en orden
+        self.redo_stack = []
+        self.version = 0
+        self._view = self.base
+        self._view_version = 0
+
+    @property
+    def key(self):
+        """Identificador de versión para cachés y exportaciones"""
+        return (self.id, self.version)
+
+    def _append(self, entry):
+        entry['usuario'] = st.session_state.get('username', '')
+        entry['fecha'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.entries.append(entry)
+        self.applied.append(len(self.entries) - 1)
+        if not entry.get('compartido'):
+            self.redo_stack.clear()
+        self.version += 1
+
+    def record(self, kind, swimmer_id, values=None):
+        """Añade un cambio ('editar', 'tiempo' o 'eliminar') sobre un nadador"""
+        if swimmer_id not in self.index:
+            raise KeyError(f"Nadador desconocido: {swimmer_id}")
+        self._append({'tipo': kind, 'id': swimmer_id, 'valores': dict(values or {})})
+
+    def record_sync(self, changed, added=None, removed=(), restored=(), shared=False):
+        """Añade en un solo cambio (deshacible) lo recibido de una sincronización.
+
+        `changed` es {IdNadador: {columna: valor}}, `added` {IdNadador: fila}
+        para nadadores nuevos, `removed` los IdNadador borrados en el origen
+        y `restored` los que vuelven a estar activos. Con `shared` el cambio
+        viene de otro usuario de la temporada compartida: queda fuera de
+        deshacer/rehacer, porque deshacerlo separaría la copia local de la fila
+        compartida.
+        """
+        added = added or {}
+        for swimmer_id in added:
+            if swimmer_id not in self.index:
+                self.index[swimmer_id] = len(self.index)
+        self._append({
+            'tipo': 'sync',
+            'id': None,
+            'valores': {swimmer_id: dict(values) for swimmer_id, values in changed.items()},
+            'altas': {swimmer_id: dict(row) for swimmer_id, row in added.items()},
+            'bajas': list(removed),
+            'restauradas': list(restored),
+            'compartido': shared
+        })
+
+    def _last_undoable(self):
+        """Posición en `applied` del último cambio deshacible, o None"""
+        for pos in range(len(self.applied) - 1, -1, -1):
+            if not self.entries[self.applied[pos]].get('compartido'):
+                return pos
+        return None
+
+    def can_undo(self):
+        return self._last_undoable() is not None
+
+    def can_redo(self):
+        return bool(self.redo_stack)
+
+    def undo(self):
+        """Deshace el último cambio propio aplicado; devuelve su entrada"""
+        pos = self._last_undoable()
+        if pos is None:
+            return None
+        index = self.applied.pop(pos)
+        self.redo_stack.append(index)
+        self.version += 1
+        return self.entries[index]
+
+    def redo(self):
+        """Rehace el último cambio deshecho; devuelve su entrada"""
+        if not self.redo_stack:
+            return None
+        index = self.redo_stack.pop()
+        self.applied.append(index)
+        self.version += 1
+        return self.entries[index]
+
+    def history(self):
+        """Cambios activos, del más reciente al más antiguo"""
+        return [self.entries[i] for i in reversed(self.applied)]
+
+    def overlay(self):
+        """Capa compacta: celdas modificadas, nadadores eliminados y nadadores añadidos"""
+        cells = {}
+        deleted = set()
+        added = {}
+        for i in self.applied:
+            entry = self.entries[i]
+            if entry['tipo'] == 'eliminar':
+                deleted.add(entry['id'])
+            elif entry['tipo'] == 'sync':
+                for swimmer_id, values in entry['valores'].items():
+                    cells.setdefault(swimmer_id, {}).update(values)
+                for swimmer_id, row in entry['altas'].items():
+                    added[swimmer_id] = row
+                    deleted.discard(swimmer_id)
+                deleted.update(entry['bajas'])
+                deleted.difference_update(entry.get('restauradas', ()))
+            else:
+                cells.setdefault(entry['id'], {}).update(entry['valores'])
+        return cells, deleted, added
+
+    def local_edits(self):
+        """Celdas y nadadores eliminados cuyo último cambio es una edición propia.
+
+        A diferencia de `overlay()`, no cuenta lo que llegó por sincronización:
+        una celda sincronizada deja de ser una edición local.
+        """
+        cells = {}
+        deleted = set()
+        for i in self.applied:
+            entry = self.entries[i]
+            if entry['tipo'] == 'sync':
+                for swimmer_id, values in entry['valores'].items():
+                    for col in values:
+                        cells.get(swimmer_id, {}).pop(col, None)
+                deleted.difference_update(entry.get('restauradas', ()))
+            elif entry['tipo'] == 'eliminar':
+                deleted.add(entry['id'])
+            else:
+                cells.setdefault(entry['id'], {}).update(entry['valores'])
+        return {swimmer_id: values for swimmer_id, values in cells.items() if values}, deleted
+
+    def contains(self, swimmer_id):
+        """True si el nadador existe y no está eliminado en la versión actual"""
+        return swimmer_id in self.index and self.index[swimmer_id] in self.view().index
+
+    def row(self, swimmer_id):
+        """Fila actual de un nadador por su IdNadador"""
+        return self.view().loc[self.index[swimmer_id]]
+
+    def view(self):
+        """DataFrame de la temporada con los cambios aplicados (cacheado por versión)"""
+        if self._view_version == self.version:
+            return self._view
+
+        cells, deleted, added = self.overlay()
+        if not cells and not deleted and not added:
+            df = self.base
+        else:
+            df = self.base.copy()
+            if added:
+                new_rows = pd.DataFrame(list(added.values()),
+                                        index=[self.index[swimmer_id] for swimmer_id in added])
+                new_rows[ID_COL] = list(added)
+                df = pd.concat([df, new_rows])
+            for swimmer_id, values in cells.items():
+                if swimmer_id in deleted or self.index[swimmer_id] not in df.index:
+                    continue
+                label = self.index[swimmer_id]
+                for col, value in values.items():
+                    # Texto/fechas sobre columnas numéricas: pasar a object
+                    if col in df.columns and df[col].dtype != object and not (
+                            pd.api.types.is_numeric_dtype(df[col]) and pd.api.types.is_number(value)):
+                        df[col] = df[col].astype(object)
+                    df.at[label, col] = value
+            if deleted:
+                # Sin reset_index: las etiquetas de fila siguen siendo estables
+                df = df.drop(index=[self.index[swimmer_id] for swimmer_id in deleted], errors='ignore')
+
+        self._view = df
+        self._view_version = self.version
+        return df
+
+def get_season_log():
+    """Registro de cambios de la temporada activa (o None)"""
+    return st.session_state.get('season_log')
+
+def current_df():
+    """Vista actual de la temporada activa"""
+    return st.session_state.season_log.view()
+
+def describe_change(log, entry):
+    """Texto corto para mostrar un cambio en el historial"""
+    if entry['tipo'] == 'sync':
+        return (f"🔄 Sincronización: {len(entry['valores'])} modificados, "
+                f"{len(entry['altas'])} altas, {len(entry['bajas'])} bajas")
+    label = log.index[entry['id']]
+    nombre = log.base.at[label, 'Nombre'] if label < len(log.base) else entry['id']
+    if entry['tipo'] == 'eliminar':
+        return f"🗑️ Eliminado {nombre} (`{entry['id']}`)"
+    campos = ", ".join(f"{col}={value}" for col, value in entry['valores'].items())
+    icon = "⏱️" if entry['tipo'] == 'tiempo' else "✏️"
+    return f"{icon} {nombre} (`{entry['id']}`): {campos}"
+
+def show_edit_history():
+    """Controles de deshacer/rehacer e historial en la barra lateral"""
+    log = get_season_log()
+    if log is None or not has_permission('edit'):
+        return
+
+    st.markdown("---")
+    st.header("🕘 Historial de Cambios")
+
+    col_undo, col_redo = st.columns(2)
+    with col_undo:
+        if st.button("↩️ Deshacer", disabled=not log.can_undo(), use_container_width=True):
+            publish_undo_redo(log, log.undo())
+            st.rerun()
+    with col_redo:
+        if st.button("↪️ Rehacer", disabled=not log.can_redo(), use_container_width=True):
+            publish_undo_redo(log, log.redo())
+            st.rerun()
+
+    history = log.history()
+    st.caption(f"Versión {log.version} · {len(history)} cambios activos")
+    shared = st.session_state.get('shared_season')
+    if shared is not None:
+        st.caption(f"🤝 Temporada compartida · {len(shared.journal)} cambios confirmados por todos los usuarios")
+    if history:
+        with st.expander("📜 Ver cambios"):
+            for entry in history[:50]:
+                st.markdown(f"- `{entry['fecha']}` {describe_change(log, entry)}")
+
+def excel_bytes(df, sheet_name):
+    """Contenido xlsx de una hoja"""
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name=sheet_name)
+    return output.getvalue()
+
+def export_excel_bytes(df, sheet_name, cache_key):
+    """Genera el Excel de descarga, reutilizándolo mientras no cambie la versión"""
+    cache = st.session_state.get('export_cache')
+    if cache and cache[0] == cache_key:
+        return cache[1]
+
+    data = excel_bytes(df, sheet_name)
+    st.session_state.export_cache = (cache_key, data)
+    return data
+
+# ============== EDICIÓN CONCURRENTE ==============
+
+# Bloqueos por franjas: cada nadador usa el lock de su franja, nunca uno global
+SHARED_LOCK_STRIPES = 64
+# Temporadas sin sesiones activas que se conservan; las que tienen sesiones nunca se descartan
+SHARED_SEASONS_MAX = 16
+# Una sesión sin reruns durante este tiempo (segundos) deja de contar como activa
+SHARED_SESSION_TIMEOUT = 3600
+# Fuentes que se comparten por identidad (URL o ruta y hoja), aunque cambie su contenido
+SHARED_BY_SOURCE = ('sheets', 'parquet')
+
+# Estado confirmado de una fila en la temporada compartida. `valores` acumula las
+# celdas cambiadas desde la base y no se modifica una vez publicado.
+RowState = namedtuple('RowState', ['version', 'valores', 'eliminado', 'usuario', 'fecha'])
+BASE_ROW = RowState(0, {}, False, '', '')
+
+class SharedSeason:
+    """Temporada compartida entre sesiones con versión por fila (bloqueo optimista).
+
+    Cada guardado indica la versión de la fila que vio el usuario; si otro la
+    confirmó antes, el guardado se rechaza y se informa como conflicto. Los
+    escritores solo bloquean la franja de su nadador, así que guardados sobre
+    nadadores distintos no se esperan entre sí. Las lecturas no bloquean: las
+    filas son tuplas inmutables que se sustituyen enteras y el diario de
+    cambios solo crece.
+    """
+
+    def __init__(self, base):
+        self.base = base
+        self.rows = {}      # IdNadador → RowState
+        self.journal = []   # IdNadador por orden de confirmación
+        self.locks = [threading.Lock() for _ in range(SHARED_LOCK_STRIPES)]
+        self.sessions = {}  # sesión → último rerun (time.monotonic)
+
+    def touch(self, session_id):
+        """Marca la sesión como enlazada y activa"""
+        self.sessions[session_id] = time.monotonic()
+
+    def detach(self, session_id):
+        self.sessions.pop(session_id, None)
+
+    def in_use(self):
+        now = time.monotonic()
+        return any(now - seen < SHARED_SESSION_TIMEOUT for seen in list(self.sessions.values()))
+
+    def state(self, swimmer_id):
+        return self.rows.get(swimmer_id, BASE_ROW)
+
+    def commit(self, swimmer_id, expected, values=None, deleted=False, author=''):
+        """Confirma un cambio si la fila sigue en la versión `expected`; devuelve (ok, estado actual)"""
+        with self.locks[hash(swimmer_id) % len(self.locks)]:
+            current = self.rows.get(swimmer_id, BASE_ROW)
+            if current.version != expected:
+                return False, current
+            valores = dict(current.valores)
+            valores.update(values or {})
+            state = RowState(current.version + 1, valores, deleted, author,
+                             datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            self.rows[swimmer_id] = state
+        self.journal.append(swimmer_id)
+        return True, state
+
+    def changes_since(self, cursor):
+        """Filas confirmadas desde la posición `cursor` del diario: (nuevo cursor, {IdNadador: RowState})"""
+        end = len(self.journal)
+        return end, {swimmer_id: self.rows[swimmer_id] for swimmer_id in set(self.journal[cursor:end])}
+
+@st.cache_resource
+def get_shared_registry():
+    """Temporadas compartidas del proceso, por fuente y hoja (y contenido si es un archivo subido)"""
+    return {'lock': threading.Lock(), 'seasons': OrderedDict()}
+
+def season_source_key(source, sheet):
+    """Identifica la fuente de una temporada para compartirla entre sesiones"""
+    if getattr(source, 'is_parquet', False):
+        return ('parquet', os.path.abspath(source.path), sheet)
+    if source is st.session_state.get('sheets_excel'):
+        return ('sheets', st.session_state.get('sheets_url'), sheet)
+    return ('archivo', getattr(getattr(source, 'io', None), 'name', ''), sheet)
+
+def attach_shared_season(source_key, df):
+    """Temporada compartida para estos datos; la crea si es la primera sesión que los carga.
+
+    Google Sheets y Parquet se comparten por su identidad: quien cargue la
+    misma URL o ruta y hoja entra en la misma temporada aunque el contenido
+    haya cambiado entretanto (lo nuevo llega luego por sincronización). Para
+    archivos subidos el contenido forma parte de la clave, así un archivo
+    distinto con el mismo nombre no se mezcla. Todas las sesiones comparten la
+    base (y sus IdNadador), aunque la hoja no los tuviera guardados.
+    """
+    key = source_key
+    if source_key[0] not in SHARED_BY_SOURCE:
+        key += (hashlib.sha256(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest(),)
+    registry = get_shared_registry()
+    with registry['lock']:
+        seasons = registry['seasons']
+        if key not in seasons:
+            seasons[key] = SharedSeason(assign_swimmer_ids(df))
+            # Descartar solo temporadas que ya no usa ninguna sesión (las más antiguas primero)
+            idle = [other for other, season in seasons.items() if other != key and not season.in_use()]
+            for other in idle[:max(len(seasons) - SHARED_SEASONS_MAX, 0)]:
+                del seasons[other]
+        seasons.move_to_end(key)
+        return seasons[key]
+
+def shared_session_id():
+    return st.session_state.setdefault('shared_session_id', uuid.uuid4().hex)
+
+def start_shared_session(season):
+    """Enlaza la sesión con una temporada compartida y trae los cambios ya confirmados"""
+    previous = st.session_state.get('shared_season')
+    if previous is not None and previous is not season:
+        previous.detach(shared_session_id())
+    season.touch(shared_session_id())
+    st.session_state.shared_season = season
+    st.session_state.shared_cursor = 0
+    st.session_state.shared_versions = {}
+    st.session_state.shown_row = None
+    st.session_state.edit_conflicts = {}
+
+def pull_shared_changes(log):
+    """Aplica al registro local lo que otros usuarios confirmaron desde el último rerun (sin bloqueos)"""
+    season = st.session_state.get('shared_season')
+    if season is None or log is None:
+        return 0
+
+    season.touch(shared_session_id())
+    cursor, states = season.changes_since(st.session_state.get('shared_cursor', 0))
+    st.session_state.shared_cursor = cursor
+    known = st.session_state.shared_versions
+    changed, removed, restored = {}, [], []
+    for swimmer_id, state in states.items():
+        if state.version <= known.get(swimmer_id, 0) or swimmer_id not in log.index:
+            continue
+        known[swimmer_id] = state.version
+        if state.eliminado:
+            removed.append(swimmer_id)
+            continue
+        if not log.contains(swimmer_id):
+            restored.append(swimmer_id)
+        if state.valores:
+            changed[swimmer_id] = state.valores
+
+    if changed or removed or restored:
+        log.record_sync(changed, removed=removed, restored=restored, shared=True)
+    return len(changed) + len(removed) + len(restored)
+
+def publish_change(log, swimmer_id, values=None, deleted=False, expected=None, kind='editar'):
+    """Confirma un cambio en la temporada compartida; devuelve False (y lo anota) si hay conflicto.
+
+    Sin temporada compartida siempre se acepta. `expected` es la versión de
+    la fila que vio el usuario (por defecto, la mostrada en el último render).
+    """
+    season = st.session_state.get('shared_season')
+    if season is None:
+        return True
+
+    known = st.session_state.shared_versions
+    shown = st.session_state.get('shown_row')
+    if expected is None:
+        expected = shown[1] if shown is not None and shown[0] == swimmer_id else known.get(swimmer_id, 0)
+    ok, state = season.commit(swimmer_id, expected, values, deleted, st.session_state.get('username', ''))
+    if ok:
+        known[swimmer_id] = state.version
+        st.session_state.shown_row = None
+        st.session_state.edit_conflicts.pop(swimmer_id, None)
+    else:
+        st.session_state.edit_conflicts[swimmer_id] = {'tipo': kind, 'valores': dict(values or {}),
+                                                       'eliminar': deleted, 'estado': state}
+    return ok
+
+def save_change(log, kind, swimmer_id, values=None):
+    """Guarda un cambio del formulario: primero en la temporada compartida y luego en el registro local"""
+    if not publish_change(log, swimmer_id, values, deleted=kind == 'eliminar', kind=kind):
+        return False
+    log.record(kind, swimmer_id, values)
+    return True
+
+def publish_undo_redo(log, entry):
+    """Publica el estado de la fila tras deshacer o rehacer un cambio propio"""
+    if entry['tipo'] == 'sync':
+        return
+    swimmer_id = entry['id']
+    if not log.contains(swimmer_id):
+        publish_change(log, swimmer_id, deleted=True, expected=st.session_state.shared_versions.get(swimmer_id, 0))
+        return
+    row = log.row(swimmer_id)
+    values = {col: row[col] for col in entry['valores'] if col in row.index}
+    publish_change(log, swimmer_id, values, expected=st.session_state.shared_versions.get(swimmer_id, 0))
+
+def shown_row(log, swimmer_id):
+    """Fila con la que se pintaron los formularios en el rerun anterior.
+
+    Si otro usuario cambió el nadador entretanto, los formularios se pintan
+    igual que antes: así Streamlit conserva lo que se estaba escribiendo y el
+    guardado se compara con la versión que se vio.
+    """
+    shown = st.session_state.get('shown_row')
+    if shown is not None and shown[0] == swimmer_id and log.contains(swimmer_id):
+        return shown[2]
+    return log.row(swimmer_id)
+
+def remember_shown_row(log, swimmer_id):
+    """Anota la fila mostrada y repinta si estaba desactualizada"""
+    if st.session_state.get('shared_season') is None or not log.contains(swimmer_id):
+        return
+    version = st.session_state.shared_versions.get(swimmer_id, 0)
+    shown = st.session_state.get('shown_row')
+    stale = shown is not None and shown[0] == swimmer_id and shown[1] != version
+    st.session_state.shown_row = (swimmer_id, version, log.row(swimmer_id))
+    if stale:
+        st.rerun()
+
+def show_edit_conflicts(log):
+    """Guardados rechazados porque otro usuario cambió antes el mismo nadador"""
+    conflicts = st.session_state.get('edit_conflicts')
+    if not conflicts:
+        return
+
+    st.warning(f"⚠️ {len(conflicts)} nadadores con conflictos: otro usuario guardó cambios antes que tú")
+    with st.expander("🤝 Resolver conflictos de edición", expanded=True):
+        for swimmer_id, conflict in list(conflicts.items()):
+            state = conflict['estado']
+            nombre = log.row(swimmer_id).get('Nombre', swimmer_id) if log.contains(swimmer_id) else swimmer_id
+            st.markdown(f"**{nombre}** (`{swimmer_id}`) · guardado por **{state.usuario or '¿?'}** el {state.fecha}")
+            if conflict['eliminar'] or state.eliminado:
+                rows = [{'Campo': '(nadador)', 'Tu cambio': 'eliminar' if conflict['eliminar'] else 'editar',
+                         'Versión guardada': 'eliminado' if state.eliminado else 'modificado'}]
+            else:
+                rows = [{'Campo': col, 'Tu cambio': value, 'Versión guardada': state.valores.get(col, '(sin cambios)')}
+                        for col, value in conflict['valores'].items()]
+            st.dataframe(pd.DataFrame(rows).astype(str), use_container_width=True, hide_index=True)
+
+            col_keep, col_discard = st.columns(2)
+            with col_keep:
+                if st.button("💾 Guardar mi versión", key=f"conflict_keep_{swimmer_id}"):
+                    season = st.session_state.shared_season
+                    expected = season.state(swimmer_id).version
+                    if publish_change(log, swimmer_id, conflict['valores'], conflict['eliminar'], expected):
+                        if log.contains(swimmer_id):
+                            log.record(conflict['tipo'], swimmer_id, conflict['valores'])
+                        else:
+                            log.record_sync({swimmer_id: conflict['valores']}, restored=[swimmer_id])
+                    st.rerun()
+            with col_discard:
+                if st.button("↩️ Quedarme con la guardada", key=f"conflict_discard_{swimmer_id}"):
+                    conflicts.pop(swimmer_id, None)
+                    st.rerun()
+
+# ============== CACHÉ DE RENDERIZADO ==============
+
+RENDER_CACHE_SIZE = 32
+
+# Paginación de la tabla principal y límite de opciones del selector
+PAGE_SIZE_OPTIONS = [25, 50, 100, 250]
+DEFAULT_PAGE_SIZE = 50
+PICKER_LIMIT = 50
+
+def render_cache_get(key, builder):
+    """Devuelve el valor cacheado para `key` o lo construye con `builder()` (LRU por sesión)"""
+    if 'render_cache' not in st.session_state:
+        st.session_state.render_cache = OrderedDict()
+    cache = st.session_state.render_cache
+
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
+
+    value = builder()
+    cache[key] = value
+    while len(cache) > RENDER_CACHE_SIZE:
+        cache.popitem(last=False)
+    return value
+
+def arrow_text(series):
+    """Columna como texto Arrow sin espacios laterales, para operaciones vectorizadas en C++"""
+    try:
+        # Columnas solo de texto: directamente, sin pasar por astype(str)
+        values = pa.array(series.values, type=pa.string(), from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        values = pa.array(series.astype(str).values, mask=series.isna().values, type=pa.string())
+    return pc.utf8_trim_whitespace(values)
+
+def arrow_to_series(values, index):
+    return pd.Series(values.to_numpy(zero_copy_only=False), index=index)
+
+def time_mask(df, prueba):
+    """Máscara vectorizada de celdas con tiempo registrado en una prueba"""
+    col = df[prueba]
+    lengths = pc.fill_null(pc.utf8_length(arrow_text(col)), 0)
+    return col.notna() & (arrow_to_series(lengths, col.index) > 0)
+
+def arrow_normalized(series):
+    """Texto Arrow en minúsculas y sin acentos"""
+    text = pc.utf8_normalize(arrow_text(series.fillna('')), 'NFKD')
+    return pc.utf8_lower(pc.replace_substring_regex(text, r'\p{Mn}', ''))
+
+def normalize_text(series):
+    """Texto en minúsculas y sin acentos, para búsquedas y claves"""
+    return arrow_to_series(arrow_normalized(series), series.index)
+
+def birth_years(df):
+    """AñoNacimiento numérico (2000 si falta)"""
+    if 'AñoNacimiento' not in df.columns:
+        return pd.Series(2000, index=df.index)
+    return pd.to_numeric(df['AñoNacimiento'], errors='coerce').fillna(2000).astype(int)
+
+def season_times_long(df):
+    """Tiempos registrados en formato largo: IdNadador, Prueba, Tiempo, Piscina, Fecha"""
+    frames = []
+    for prueba in PRUEBAS:
+        if prueba not in df.columns:
+            continue
+        mask = time_mask(df, prueba)
+        if not mask.any():
+            continue
+        piscina_col, fecha_col = f"{prueba}Piscina", f"{prueba}Fecha"
+        # Solo las columnas de la prueba: evita copiar la hoja completa 18 veces
+        sub = df.loc[mask, [col for col in (ID_COL, prueba, piscina_col, fecha_col) if col in df.columns]]
+        frames.append(pd.DataFrame({
+            ID_COL: sub[ID_COL].values,
+            'Prueba': prueba,
+            'Tiempo': sub[prueba].values,
+            'Piscina': sub[piscina_col].values if piscina_col in sub.columns else None,
+            'Fecha': sub[fecha_col].values if fecha_col in sub.columns else None
+        }))
+
+    if not frames:
+        return pd.DataFrame(columns=[ID_COL, 'Prueba', 'Tiempo', 'Piscina', 'Fecha'])
+    return pd.concat(frames, ignore_index=True)
+
+def build_event_lists(df, scores):
+    """Tiempos de todos los nadadores en una tabla larga ordenada por IdNadador.
+
+    Devuelve {'frame': tabla, 'ids': IdNadador distintos ordenados, 'codes':
+    posición en 'ids' de cada fila}; los tiempos de un nadador son el tramo
+    [inicio, fin) que da `searchsorted` sobre 'codes'.
+    """
+    events = season_times_long(df)
+    # Mismo orden de filas que las puntuaciones
+    events['Puntos FINA'] = scores['Puntos'].values
+    events['Percentil'] = scores['Percentil'].values
+    events['Tiempo'] = events['Tiempo'].astype(str)
+    events['Piscina'] = events['Piscina'].fillna('').astype(str)
+    events['Fecha'] = events['Fecha'].where(events['Fecha'].notna(), '').astype(str)
+    # Ordenar códigos enteros (estable: dentro de cada nadador se mantiene el orden de PRUEBAS)
+    codes, ids = pd.factorize(events[ID_COL].astype(str), sort=True)
+    order = np.argsort(codes, kind='stable')
+    return {'frame': events.take(order).reset_index(drop=True), 'ids': np.asarray(ids), 'codes': codes[order]}
+
+def build_roster_render(df, categories, scores):
+    """Tabla de visualización completa, etiquetas y tiempos de cada nadador"""
+    counts = pd.Series(0, index=df.index)
+    for prueba in PRUEBAS:
+        if prueba in df.columns:
+            counts += time_mask(df, prueba)
+
+    available = df['Disponible'].fillna(False).astype(bool)
+    display_df = df[[ID_COL, 'Nombre', 'Sexo', 'AñoNacimiento']].copy()
+    display_df['Edad'] = categories['Edad']
+    display_df['Categoría'] = categories['Categoría']
+    best_scores = swimmer_scores(df, scores)
+    display_df['Puntos FINA'] = best_scores['Puntos']
+    display_df['Percentil'] = best_scores['Percentil']
+    display_df['Disponible'] = available.map({True: '✅ Sí', False: '❌ No'})
+    display_df['Tiempos Registrados'] = counts.astype(str) + " tiempos"
+
+    labels = (df['Nombre'].astype(str) + " (" + df['Sexo'].astype(str) + ", "
+              + df['AñoNacimiento'].astype(str) + ")")
+
+    return {
+        'display': display_df,
+        'labels': labels,
+        'search_keys': normalize_text(df['Nombre']),
+        'available': available,
+        'times_count': counts,
+        'events': build_event_lists(df, scores)
+    }
+
+def get_roster_render(log):
+    """Datos de visualización de la temporada, construidos una vez por versión"""
+    return render_cache_get(('roster', log.key, st.session_state.get('current_sheet')),
+                            lambda: build_roster_render(log.view(), get_season_categories(log), get_season_scores(log)))
+
+def get_filtered_render(log, search, filter_sex, filter_available, filter_category="Todas"):
+    """Tabla filtrada y estadísticas, cacheadas por (versión, filtros)"""
+    def build():
+        df = log.view()
+        roster = get_roster_render(log)
+
+        mask = pd.Series(True, index=df.index)
+        if search:
+            query = normalize_text(pd.Series([search])).iloc[0]
+            mask &= roster['search_keys'].str.contains(query, regex=False)
+        if filter_sex != "Todos":
+            mask &= df['Sexo'] == filter_sex
+        if filter_available == "Disponibles":
+            mask &= roster['available']
+        elif filter_available == "No disponibles":
+            mask &= ~roster['available']
+        if filter_category != "Todas":
+            mask &= roster['display']['Categoría'] == filter_category
+
+        display_df = roster['display'][mask]
+        total_times = sum(int(df.loc[mask, prueba].notna().sum())
+                          for prueba in PRUEBAS if prueba in df.columns)
+        return {
+            'key': key,
+            'display': display_df,
+            'stats': {
+                'total': int(mask.sum()),
+                'available': int(roster['available'][mask].sum()),
+                'times': total_times,
+                'avg_age': float(display_df['Edad'].mean()) if display_df['Edad'].notna().any() else 0.0
+            }
+        }
+
+    key = ('filtro', log.key, st.session_state.get('current_sheet'), search, filter_sex, filter_available, filter_category)
+    return render_cache_get(key, build)
+
+def get_page(log, filtered, sort_col, ascending, page, page_size):
+    """Página visible de la tabla filtrada, ordenada en el servidor"""
+    def build_order():
+        display_df = filtered['display']
+        if sort_col == 'Tiempos Registrados':
+            keys = get_roster_render(log)['times_count'].loc[display_df.index]
+        else:
+            keys = display_df[sort_col]
+        return keys.sort_values(ascending=ascending, kind='mergesort', na_position='last').index
+
+    order = render_cache_get(('orden',) + filtered['key'] + (sort_col, ascending), build_order)
+    start = (page - 1) * page_size
+    return filtered['display'].loc[order[start:start + page_size]]
+
+def search_swimmers(log, filtered, query, limit=PICKER_LIMIT):
+    """IdNadador de los nadadores filtrados cuyo nombre contiene `query` (primero los que empiezan por él)"""
+    def build():
+        display_df = filtered['display']
+        keys = get_roster_render(log)['search_keys'].loc[display_df.index]
+        normalized = normalize_text(pd.Series([query])).iloc[0]
+        starts = keys.str.startswith(normalized)
+        contains = keys.str.contains(normalized, regex=False)
+        ids = display_df[ID_COL]
+        return list(ids[starts].iloc[:limit]) + list(ids[contains & ~starts].iloc[:max(limit - int(starts.sum()), 0)])
+
+    return render_cache_get(('buscar',) + filtered['key'] + (query,), build)
+
+def get_swimmer_detail(log, swimmer_id):
+    """Tiempos de un nadador para el panel de detalle (tramo de la tabla larga, cacheado por versión)"""
+    def build():
+        events = get_roster_render(log)['events']
+        code = int(np.searchsorted(events['ids'], str(swimmer_id)))
+        if code == len(events['ids']) or events['ids'][code] != str(swimmer_id):
+            return None
+        start, end = np.searchsorted(events['codes'], [code, code + 1])
+        return events['frame'].iloc[start:end].drop(columns=ID_COL).reset_index(drop=True)
+
+    return render_cache_get(('detalle', log.key, st.session_state.get('current_sheet'), swimmer_id), build)
+
 # ============== CONVERSOR DE TIEMPOS MASIVO ==============
 
 class TimeConverter:
     """Conversor de tiempos entre piscinas"""
     
-    def time_to_centesimas(self, time_str):
-        """Convierte tiempo a centésimas"""
-        try:
-            time_str = str(time_str).strip().replace(',', '.')
-            if ':' in time_str:
-                parts = time_str.split(':')
-                if len(parts) == 3:  # hh:mm:ss.cc
-                    hours, minutes, seconds = int(parts[0]), int(parts[1]), float(parts[2])
-                    return int((hours * 3600 + minutes * 60 + seconds) * 100)
-                else:  # mm:ss.cc
-                    minutes, seconds = int(parts[0]), float(parts[1])
-                    return int((minutes * 60 + seconds) * 100)
-            else:  # ss.cc
-                return int(float(time_str) * 100)
-        except:
-            return None
-    
-    def centesimas_to_time(self, centesimas):
-        """Convierte centésimas a tiempo"""
-        try:
-            total_seconds = centesimas / 100
-            minutes = int(total_seconds // 60)
-            seconds = total_seconds % 60
-            return f"{minutes:02d}:{seconds:05.2f}"
-        except:
-            return None
-    
     def get_style_distance(self, prueba):
         """Extrae estilo y distancia de la prueba"""
         try:
@@ -400,31 +1377,56 @@ class TimeConverter:
         except:
             return "Libre", 50
     
-    def convert_time(self, time_original, pool_from, pool_to, style, distance):
-        """Convierte tiempo entre piscinas"""
-        if pool_from == pool_to:
-            return time_original
-        
-        centesimas = self.time_to_centesimas(time_original)
-        if centesimas is None:
-            return time_original
-        
-        base_increment = CONVERSION_DATA["increments"].get(style, 80)
-        
+    def increment(self, style, distance):
+        """Diferencia en centésimas entre piscina de 25m y de 50m"""
         if distance in CONVERSION_DATA["special"]:
-            total_increment = CONVERSION_DATA["special"][distance]
-        else:
-            multiplier = CONVERSION_DATA["multipliers"].get(distance, 1)
-            total_increment = base_increment * multiplier
-        
-        if pool_from == "25m" and pool_to == "50m":
-            converted_centesimas = centesimas + total_increment
-        elif pool_from == "50m" and pool_to == "25m":
-            converted_centesimas = centesimas - total_increment
+            return CONVERSION_DATA["special"][distance]
+        base_increment = CONVERSION_DATA["increments"].get(style, 80)
+        return base_increment * CONVERSION_DATA["multipliers"].get(distance, 1)
+
+def conversion_plan(df, target_pool_type):
+    """Tiempos registrados y convertibles por prueba (máscaras vectorizadas)"""
+    plan = {}
+    for prueba in PRUEBAS:
+        if prueba not in df.columns:
+            continue
+        has_time = time_mask(df, prueba)
+        piscina_col = f"{prueba}Piscina"
+        if piscina_col in df.columns:
+            pool = arrow_to_series(arrow_text(df[piscina_col]), df.index).fillna('')
+            source = "25" if target_pool_type == "50m" else "50"
+            convertible = has_time & pool.str.contains(source, regex=False)
         else:
-            return time_original
-        
-        return self.centesimas_to_time(converted_centesimas) or time_original
+            convertible = pd.Series(False, index=df.index)
+        plan[prueba] = (has_time, convertible)
+    return plan
+
+def convert_pool_times(df, plan, target_pool_type):
+    """Tiempos convertidos a la piscina destino; los de formato incorrecto se mantienen"""
+    converter = TimeConverter()
+    sign = 1 if target_pool_type == "50m" else -1
+    converted = df.copy()
+    for prueba, (_, convertible) in plan.items():
+        if not convertible.any():
+            continue
+        centesimas = times_to_centesimas(df.loc[convertible, prueba])
+        parsed = centesimas.dropna()
+        parsed = parsed + sign * converter.increment(*converter.get_style_distance(prueba))
+        converted[prueba] = converted[prueba].astype(object)
+        converted.loc[parsed.index, prueba] = format_centesimas(parsed)
+        converted.loc[parsed.index, f"{prueba}Piscina"] = target_pool_type
+    return converted
+
+def get_conversion_plan(log, target_pool_type):
+    """Análisis de la conversión, cacheado por versión de los datos"""
+    def build():
+        plan = conversion_plan(log.view(), target_pool_type)
+        return {
+            'plan': plan,
+            'total': int(sum(has_time.sum() for has_time, _ in plan.values())),
+            'convertible': int(sum(convertible.sum() for _, convertible in plan.values()))
+        }
+    return render_cache_get(('conversion', log.key, target_pool_type), build)
 
 def show_mass_conversion():
     """Sistema de conversión masiva"""
@@ -432,15 +1434,15 @@ def show_mass_conversion():
         st.error("❌ Sin permisos para conversión de tiempos")
         return
     
-    if 'df' not in st.session_state:
+    if get_season_log() is None:
         st.warning("⚠️ Carga primero una temporada para convertir tiempos")
         return
     
     st.header("🔄 Conversión Masiva de Tiempos")
     st.markdown("### Convierte todos los tiempos de todos los nadadores de una vez")
     
-    converter = TimeConverter()
-    df = st.session_state.df.copy()
+    season_log = get_season_log()
+    df = season_log.view()
     
     # Configuración de conversión
     col1, col2 = st.columns(2)
@@ -455,29 +1457,21 @@ def show_mass_conversion():
         
         target_pool_type = "50m" if "50m" in target_pool else "25m"
         
-        # Detectar qué tiempos se pueden convertir
-        convertible_times = 0
-        total_times = 0
-        
-        for prueba in PRUEBAS:
-            if prueba in df.columns:
-                piscina_col = f"{prueba}Piscina"
-                for idx, row in df.iterrows():
-                    tiempo = row.get(prueba, '')
-                    piscina = row.get(piscina_col, '')
-                    
-                    if pd.notna(tiempo) and str(tiempo).strip():
-                        total_times += 1
-                        if pd.notna(piscina) and str(piscina).strip():
-                            piscina_str = str(piscina).strip()
-                            if ("25" in piscina_str and target_pool_type == "50m") or \
-                               ("50" in piscina_str and target_pool_type == "25m"):
-                                convertible_times += 1
+        # Detectar qué tiempos se pueden convertir (una vez por versión)
+        analysis = get_conversion_plan(season_log, target_pool_type)
+        plan = analysis['plan']
+        convertible_times = analysis['convertible']
+        total_times = analysis['total']
         
         st.info(f"📊 **Análisis:**")
         st.info(f"• Total de tiempos: {total_times}")
         st.info(f"• Convertibles: {convertible_times}")
         st.info(f"• Ya en {target_pool_type}: {total_times - convertible_times}")
+        
+        report = get_quality_report(season_log)
+        bad_times = int((report['Problema'] == "Formato de tiempo incorrecto").sum())
+        if bad_times:
+            st.warning(f"⚠️ {bad_times} tiempos con formato incorrecto se mantendrán sin convertir")
     
     with col2:
         st.subheader("📋 Vista Previa")
@@ -486,33 +1480,22 @@ def show_mass_conversion():
             preview_data = []
             
             for prueba in PRUEBAS[:5]:  # Solo mostrar las primeras 5 pruebas como ejemplo
-                if prueba in df.columns:
-                    piscina_col = f"{prueba}Piscina"
-                    for idx, row in df.iterrows():
-                        tiempo = row.get(prueba, '')
-                        piscina = row.get(piscina_col, '')
-                        nombre = row.get('Nombre', 'Sin nombre')
-                        
-                        if pd.notna(tiempo) and str(tiempo).strip() and pd.notna(piscina):
-                            piscina_str = str(piscina).strip()
-                            if ("25" in piscina_str and target_pool_type == "50m") or \
-                               ("50" in piscina_str and target_pool_type == "25m"):
-                                style, distance = converter.get_style_distance(prueba)
-                                converted_time = converter.convert_time(
-                                    str(tiempo), piscina_str, target_pool_type, style, distance
-                                )
-                                
-                                preview_data.append({
-                                    'Nadador': nombre,
-                                    'Prueba': prueba,
-                                    'Tiempo Original': f"{tiempo} ({piscina_str})",
-                                    'Tiempo Convertido': f"{converted_time} ({target_pool_type})"
-                                })
-                                
-                                if len(preview_data) >= 10:  # Limitar vista previa
-                                    break
-                    if len(preview_data) >= 10:
-                        break
+                if prueba not in plan:
+                    continue
+                rows = df[plan[prueba][1]].head(10 - len(preview_data))
+                if rows.empty:
+                    continue
+                converted = convert_pool_times(rows, {prueba: (plan[prueba][0][rows.index], plan[prueba][1][rows.index])},
+                                               target_pool_type)
+                for idx in rows.index:
+                    preview_data.append({
+                        'Nadador': rows.at[idx, 'Nombre'],
+                        'Prueba': prueba,
+                        'Tiempo Original': f"{rows.at[idx, prueba]} ({str(rows.at[idx, f'{prueba}Piscina']).strip()})",
+                        'Tiempo Convertido': f"{converted.at[idx, prueba]} ({target_pool_type})"
+                    })
+                if len(preview_data) >= 10:  # Limitar vista previa
+                    break
             
             if preview_data:
                 st.dataframe(pd.DataFrame(preview_data), use_container_width=True)
@@ -531,63 +1514,22 @@ def show_mass_conversion():
             if st.button(f"🔄 Convertir {convertible_times} tiempos a {target_pool_type}", 
                         type="primary", use_container_width=True):
                 
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-                
-                converted_count = 0
-                total_to_convert = convertible_times
-                
-                # Crear DataFrame convertido
-                df_converted = df.copy()
-                
-                for i, prueba in enumerate(PRUEBAS):
-                    if prueba in df_converted.columns:
-                        piscina_col = f"{prueba}Piscina"
-                        
-                        for idx, row in df_converted.iterrows():
-                            tiempo = row.get(prueba, '')
-                            piscina = row.get(piscina_col, '')
-                            
-                            if pd.notna(tiempo) and str(tiempo).strip() and pd.notna(piscina):
-                                piscina_str = str(piscina).strip()
-                                
-                                # Determinar si necesita conversión
-                                needs_conversion = False
-                                if ("25" in piscina_str and target_pool_type == "50m") or \
-                                   ("50" in piscina_str and target_pool_type == "25m"):
-                                    needs_conversion = True
-                                
-                                if needs_conversion:
-                                    style, distance = converter.get_style_distance(prueba)
-                                    converted_time = converter.convert_time(
-                                        str(tiempo), piscina_str, target_pool_type, style, distance
-                                    )
-                                    
-                                    # Actualizar datos
-                                    df_converted.at[idx, prueba] = converted_time
-                                    df_converted.at[idx, piscina_col] = target_pool_type
-                                    
-                                    converted_count += 1
-                                    
-                                    # Actualizar progreso
-                                    progress = converted_count / total_to_convert
-                                    progress_bar.progress(progress)
-                                    status_text.text(f"Convirtiendo: {converted_count}/{total_to_convert}")
+                # Crear DataFrame convertido (vectorizado por prueba)
+                df_converted = convert_pool_times(df, plan, target_pool_type)
                 
                 # Guardar resultado en session state
                 st.session_state.df_converted = df_converted
                 st.session_state.conversion_info = {
                     'target_pool': target_pool_type,
-                    'converted_count': converted_count,
+                    'converted_count': convertible_times,
                     'total_times': total_times,
+                    'result_times': int(sum(time_mask(df_converted, prueba).sum()
+                                            for prueba in PRUEBAS if prueba in df_converted.columns)),
                     'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 }
                 
-                progress_bar.progress(1.0)
-                status_text.text("✅ Conversión completada")
-                
                 st.success(f"🎉 **Conversión exitosa!**")
-                st.success(f"✅ {converted_count} tiempos convertidos a {target_pool_type}")
+                st.success(f"✅ {convertible_times} tiempos convertidos a {target_pool_type}")
                 st.info("📥 Ahora puedes descargar el Excel con los tiempos convertidos")
         
         with col_info:
@@ -611,25 +1553,18 @@ def show_mass_conversion():
             st.info(f"🔄 **A piscina:** {info['target_pool']}")
             st.info(f"📊 **Tiempos convertidos:** {info['converted_count']}")
             
-            # Crear archivo Excel con datos convertidos
-            output = io.BytesIO()
+            # Crear archivo Excel con datos convertidos (una vez por conversión)
             try:
                 current_sheet = st.session_state.get('current_sheet', 'Temporada')
-                
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    st.session_state.df_converted.to_excel(
-                        writer, 
-                        index=False, 
-                        sheet_name=f"{current_sheet}_Convertido_{info['target_pool']}"
-                    )
-                
-                output.seek(0)
+                sheet_name = f"{current_sheet}_Convertido_{info['target_pool']}"
+                data = render_cache_get(('convertido', info['timestamp'], info['target_pool']),
+                                        lambda: excel_bytes(st.session_state.df_converted, sheet_name))
                 
                 filename = f"nadadores_convertidos_{info['target_pool']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
                 
                 st.download_button(
                     label=f"📥 Descargar Excel Convertido a {info['target_pool']}",
-                    data=output.getvalue(),
+                    data=data,
                     file_name=filename,
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                     type="primary",
@@ -642,10 +1577,8 @@ def show_mass_conversion():
         with col2:
             # Comparación rápida
             st.subheader("📊 Comparación")
-            original_times = len([t for prueba in PRUEBAS if prueba in st.session_state.df.columns 
-                                for t in st.session_state.df[prueba] if pd.notna(t) and str(t).strip()])
-            converted_times = len([t for prueba in PRUEBAS if prueba in st.session_state.df_converted.columns 
-                                 for t in st.session_state.df_converted[prueba] if pd.notna(t) and str(t).strip()])
+            original_times = info['total_times']
+            converted_times = info['result_times']
             
             st.metric("Tiempos Originales", original_times)
             st.metric("Tiempos Convertidos", converted_times)
@@ -653,20 +1586,20 @@ def show_mass_conversion():
 
 # ============== VALIDADORES ==============
 
+TIME_PATTERNS = [
+    r'^\d{1,2}:\d{2}\.\d{2}$',  # mm:ss.cc
+    r'^\d{1,2}:\d{2},\d{2}$',   # mm:ss,cc
+    r'^\d{1,3}\.\d{2}$',        # ss.cc
+    r'^\d{1,2}:\d{2}$',         # mm:ss
+]
+
 def validate_time_format(time_str):
     """Valida formato de tiempo"""
     if not time_str or not time_str.strip():
         return True, ""
     
-    patterns = [
-        r'^\d{1,2}:\d{2}\.\d{2}$',  # mm:ss.cc
-        r'^\d{1,2}:\d{2},\d{2}$',   # mm:ss,cc
-        r'^\d{1,3}\.\d{2}$',        # ss.cc
-        r'^\d{1,2}:\d{2}$',         # mm:ss
-    ]
-    
     time_str = time_str.strip()
-    for pattern in patterns:
+    for pattern in TIME_PATTERNS:
         if re.match(pattern, time_str):
             return True, "✓"
     
@@ -696,27 +1629,1909 @@ def normalize_time(time_str):
     except:
         return time_str
 
-# ============== APLICACIÓN PRINCIPAL ==============
+# ============== CALIDAD DE DATOS ==============
 
-def main():
-    initialize_users()
+VALID_POOLS = ['25m', '50m']
+
+# Umbral de la puntuación z robusta (mediana/MAD) para marcar tiempos atípicos
+OUTLIER_Z = 3.5
+OUTLIER_MIN_SAMPLES = 8
+
+def times_to_centesimas(series):
+    """Tiempos (ss.cc, mm:ss.cc o hh:mm:ss.cc) a centésimas redondeadas (NaN si no se puede leer)"""
+    text = pc.replace_substring(arrow_text(series), ',', '.')
+    parts = pc.extract_regex(text, r'^(?:(?:(?P<h>\d+):)?(?P<m>\d+):)?(?P<s>\d+(?:\.\d+)?)$')
     
-    # Verificar autenticación
-    if not check_authentication():
-        return
+    def number(name, default):
+        field = pc.struct_field(parts, name)
+        field = pc.if_else(pc.equal(field, ''), default, field)
+        return arrow_to_series(pc.cast(field, 'float64'), series.index)
     
-    # Inicializar conversor
+    total = number('h', '0') * 3600 + number('m', '0') * 60 + number('s', None)
+    return (total * 100).round()
+
+def time_format_ok(series):
+    """Máscara vectorizada: el tiempo cumple algún patrón de TIME_PATTERNS"""
+    pattern = '|'.join(f"(?:{p})" for p in TIME_PATTERNS)
+    matches = pc.fill_null(pc.match_substring_regex(arrow_text(series), pattern), False)
+    return arrow_to_series(matches, series.index).astype(bool)
+
+def pool_increments():
+    """Incremento 25m→50m en centésimas para cada prueba"""
     converter = TimeConverter()
-    
-    # Título
-    st.title("🏊‍♂️ Club Natación Las Palmas")
-    st.markdown("### 🏆 Sistema Integral de Gestión de Temporadas")
-    
-    # Navegación principal por pestañas
-    if has_permission('user_management'):
-        tabs = st.tabs(["🏊‍♂️ Gestión Nadadores", "🔄 Conversión Masiva", "👥 Gestión Usuarios"])
-    else:
-        tabs = st.tabs(["🏊‍♂️ Gestión Nadadores", "🔄 Conversión Masiva"])
+    return {prueba: converter.increment(*converter.get_style_distance(prueba)) for prueba in PRUEBAS}
+
+def to_pool(centesimas, pruebas, pools, target):
+    """Centésimas convertidas a la piscina `target` con los incrementos de TimeConverter"""
+    increments = pruebas.map(pool_increments())
+    if target == '50m':
+        return centesimas + increments.where(pools == '25m', 0)
+    return centesimas - increments.where(pools == '50m', 0)
+
+def to_long_course(centesimas, pruebas, pools):
+    """Centésimas equivalentes en piscina de 50m (vectorizado)"""
+    return to_pool(centesimas, pruebas, pools, '50m')
+
+def swimmer_key(df):
+    """Clave normalizada de identidad: nombre|año|sexo (unida en Arrow)"""
+    name = arrow_normalized(df['Nombre'])
+    year = pc.cast(pa.array(birth_years(df).to_numpy()), pa.string())
+    sex = pc.utf8_upper(arrow_text(df['Sexo'].fillna('')))
+    return arrow_to_series(pc.binary_join_element_wise(name, year, sex, '|'), df.index)
+
+def scan_season_quality(df):
+    """Revisa todos los tiempos de la temporada y devuelve un informe de incidencias.
+
+    El informe está indexado por (IdNadador, Prueba) e incluye formatos de
+    tiempo incorrectos, piscinas distintas de 25m/50m, fechas vacías, tiempos
+    atípicos para su prueba y sexo, y nadadores duplicados.
+    """
+    columns = [ID_COL, 'Prueba', 'Nombre', 'Problema', 'Valor']
+    ids = df[ID_COL].values
+    nombres = pd.Series(df['Nombre'].values, index=ids)
+    sex_codes = pd.Series(pd.factorize(df['Sexo'].fillna(''))[0], index=ids)
+    issues = []
+
+    long = season_times_long(df)
+    if not long.empty:
+        tiempo = arrow_to_series(arrow_text(long['Tiempo']), long.index)
+        pool = arrow_to_series(arrow_text(long['Piscina'].fillna('')), long.index)
+        fecha = long['Fecha']
+
+        bad_format = ~time_format_ok(tiempo)
+        bad_pool = ~pool.isin(VALID_POOLS)
+        no_date = fecha.isna() | (fecha == '')
+
+        # Atípicos: puntuación z robusta sobre el tiempo equivalente en 50m, por prueba y sexo
+        cent = to_long_course(times_to_centesimas(tiempo).where(~bad_format), long['Prueba'], pool)
+        prueba_codes = long['Prueba'].map({prueba: i for i, prueba in enumerate(PRUEBAS)})
+        group = prueba_codes * (sex_codes.max() + 1) + long[ID_COL].map(sex_codes)
+        median = cent.groupby(group).transform('median')
+        mad = (cent - median).abs().groupby(group).transform('median')
+        count = cent.groupby(group).transform('count')
+        robust_z = (cent - median).abs() / (1.4826 * mad)
+        outlier = (count >= OUTLIER_MIN_SAMPLES) & (mad > 0) & (robust_z > OUTLIER_Z)
+
+        for mask, problem, values in [
+            (bad_format, "Formato de tiempo incorrecto", lambda m: tiempo[m]),
+            (bad_pool, "Piscina no válida", lambda m: pool[m].replace('', '(vacía)')),
+            (no_date, "Fecha vacía", lambda m: tiempo[m]),
+            (outlier, "Tiempo atípico", lambda m: tiempo[m] + " (z=" + robust_z[m].round(1).astype(str) + ")"),
+        ]:
+            if mask.any():
+                issues.append(pd.DataFrame({
+                    ID_COL: long.loc[mask, ID_COL],
+                    'Prueba': long.loc[mask, 'Prueba'],
+                    'Problema': problem,
+                    'Valor': values(mask)
+                }))
+
+    keys = swimmer_key(df)
+    duplicated = keys.duplicated(keep=False)
+    if duplicated.any():
+        issues.append(pd.DataFrame({
+            ID_COL: df.loc[duplicated, ID_COL],
+            'Prueba': '',
+            'Problema': "Nadador duplicado",
+            'Valor': keys[duplicated]
+        }))
+
+    if not issues:
+        return pd.DataFrame(columns=columns).set_index([ID_COL, 'Prueba'])
+    report = pd.concat(issues, ignore_index=True)
+    report['Nombre'] = report[ID_COL].map(nombres)
+    return report[columns].set_index([ID_COL, 'Prueba']).sort_index()
+
+def get_quality_report(log):
+    """Informe de calidad de la versión actual (cacheado por versión)"""
+    return render_cache_get(('calidad', log.key), lambda: scan_season_quality(log.view()))
+
+def show_quality_report(log):
+    """Panel con las incidencias de calidad de la temporada"""
+    report = get_quality_report(log)
+    if report.empty:
+        return
+
+    with st.expander(f"🩺 Calidad de Datos ({len(report)} incidencias)"):
+        summary = report['Problema'].value_counts()
+        cols = st.columns(len(summary))
+        for col, (problem, count) in zip(cols, summary.items()):
+            with col:
+                st.metric(problem, int(count))
+
+        problem = st.selectbox("Tipo de incidencia", ["Todas"] + list(summary.index))
+        shown = report if problem == "Todas" else report[report['Problema'] == problem]
+        st.dataframe(shown.head(1000), use_container_width=True)
+        if len(shown) > 1000:
+            st.info(f"... mostrando 1000 de {len(shown)} incidencias")
+
+# ============== SINCRONIZACIÓN CON GOOGLE SHEETS ==============
+
+# Intervalo por defecto entre consultas a Google Sheets (segundos)
+SYNC_INTERVAL = 60
+# Sin reruns de la sesión durante este tiempo (segundos), el hilo se detiene solo
+SYNC_IDLE_TIMEOUT = 900
+# Parecido mínimo (0-1) para tratar un nombre cambiado como el mismo nadador
+SYNC_NAME_SIMILARITY = 0.8
+
+def occurrence_key(df):
+    """Clave nombre|año|sexo numerada por aparición, para distinguir duplicados"""
+    keys = swimmer_key(df)
+    return keys + "#" + keys.groupby(keys).cumcount().astype(str)
+
+def same_swimmer(local, remote):
+    """True si dos filas parecen el mismo nadador con un solo dato corregido.
+
+    Vale un nombre parecido con el mismo año y sexo, o el mismo nombre con el
+    año o el sexo cambiado. Un nadador distinto en esa fila no se parece.
+    """
+    names = normalize_text(pd.Series([local['Nombre'], remote['Nombre']]))
+    same_year = birth_years(pd.DataFrame([local, remote])).nunique() == 1
+    same_sex = str(local.get('Sexo', '')).strip().upper() == str(remote.get('Sexo', '')).strip().upper()
+    if names[0] == names[1]:
+        return same_year or same_sex
+    similar = SequenceMatcher(None, names[0], names[1]).ratio() >= SYNC_NAME_SIMILARITY
+    return similar and same_year and same_sex
+
+def align_remote(baseline, remote):
+    """Asigna a cada fila remota el IdNadador local (por IdNadador o por nombre|año|sexo).
+
+    Las filas sin pareja por clave heredan el Id de la fila en la misma
+    posición si nadie lo ha reclamado y sigue siendo el mismo nadador
+    (`same_swimmer`: un nombre, año o sexo corregido); si no, son altas.
+    """
+    remote = remote.reset_index(drop=True)
+    if ID_COL in remote.columns and remote[ID_COL].notna().all() \
+            and remote[ID_COL].astype(str).str.strip().is_unique:
+        ids = remote[ID_COL].astype(str).str.strip()
+    else:
+        key_to_id = dict(zip(occurrence_key(baseline), baseline[ID_COL]))
+        ids = occurrence_key(remote).map(key_to_id)
+        existing = set(baseline[ID_COL])
+        taken = set(ids.dropna())
+        baseline = baseline.reset_index(drop=True)
+        for i in ids[ids.isna()].index:
+            if (i < len(baseline) and baseline.at[i, ID_COL] not in taken
+                    and same_swimmer(baseline.loc[i], remote.loc[i])):
+                ids[i] = baseline.at[i, ID_COL]
+            else:
+                ids[i] = new_swimmer_id(existing)
+                existing.add(ids[i])
+            taken.add(ids[i])
+    remote = remote.drop(columns=[ID_COL], errors='ignore')
+    remote.insert(0, ID_COL, ids.values)
+    return remote
+
+def same_value(a, b):
+    """Igualdad de celdas tratando los vacíos (NaN/None/NaT) como iguales"""
+    if pd.isna(a) and pd.isna(b):
+        return True
+    try:
+        return bool(a == b)
+    except (TypeError, ValueError):
+        return False
+
+def diff_season(baseline, remote):
+    """Diferencias por fila y celda entre la última versión sincronizada y la remota.
+
+    Devuelve {'changed': {IdNadador: {col: valor}}, 'added': {IdNadador: fila},
+    'removed': [IdNadador]}.
+    """
+    base = baseline.set_index(ID_COL)
+    rem = remote.set_index(ID_COL)
+    common = rem.index.intersection(base.index)
+    columns = list(rem.columns)
+
+    b = base.reindex(index=common, columns=columns)
+    r = rem.loc[common, columns]
+    equal = (b == r) | (b.isna() & r.isna())
+    rows, cols = (~equal).to_numpy().nonzero()
+
+    changed = {}
+    values = r.to_numpy()
+    for row, col in zip(rows, cols):
+        changed.setdefault(common[row], {})[columns[col]] = values[row, col]
+
+    added_ids = rem.index.difference(base.index)
+    return {
+        'changed': changed,
+        'added': {swimmer_id: row.dropna().to_dict() for swimmer_id, row in rem.loc[added_ids].iterrows()},
+        'removed': list(base.index.difference(rem.index))
+    }
+
+def diff_has_changes(diff):
+    return bool(diff['changed'] or diff['added'] or diff['removed'])
+
+def apply_remote_diff(log, diff):
+    """Aplica al registro las filas cambiadas en remoto; devuelve los conflictos con ediciones locales"""
+    cells, deleted = log.local_edits()
+    conflicts = []
+    changed = {}
+
+    for swimmer_id, values in diff['changed'].items():
+        local = cells.get(swimmer_id, {})
+        clean = {}
+        for col, value in values.items():
+            if col in local and not same_value(local[col], value):
+                conflicts.append({ID_COL: swimmer_id, 'Columna': col, 'Local': local[col], 'Remoto': value})
+            else:
+                clean[col] = value
+        if swimmer_id in deleted:
+            conflicts.append({ID_COL: swimmer_id, 'Columna': '(fila)', 'Local': 'eliminado', 'Remoto': 'modificado'})
+        elif clean:
+            changed[swimmer_id] = clean
+
+    removed = []
+    for swimmer_id in diff['removed']:
+        if swimmer_id in cells:
+            conflicts.append({ID_COL: swimmer_id, 'Columna': '(fila)', 'Local': 'modificado', 'Remoto': 'eliminado'})
+        else:
+            removed.append(swimmer_id)
+
+    if changed or diff['added'] or removed:
+        log.record_sync(changed, diff['added'], removed)
+    return conflicts
+
+class SheetsSyncWorker:
+    """Consulta Google Sheets en segundo plano y prepara el diff con la última versión sincronizada.
+
+    Corre un bucle asyncio en un hilo propio. La descarga y la lectura del
+    xlsx se hacen en el executor; si el contenido no cambia (mismo hash) no
+    se recalcula nada. La sesión recoge el resultado con `take_pending()` en
+    su siguiente rerun y confirma la nueva base con `ack()`. Cada rerun llama a
+    `touch()`; si la sesión se abandona, el hilo termina tras `idle_timeout`.
+    `fetch` sustituye la descarga (pruebas con datos locales).
+    """
+
+    def __init__(self, url, sheet, baseline, interval=SYNC_INTERVAL, idle_timeout=SYNC_IDLE_TIMEOUT, fetch=None):
+        self.url = url
+        self.fetch = fetch
+        self.sheet = sheet
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self.last_seen = time.monotonic()
+        self.baseline = baseline
+        self.lock = threading.Lock()
+        self.pending = None
+        self.last_digest = None
+        self.last_check = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=lambda: asyncio.run(self._run()), daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def touch(self):
+        """Señal de vida de la sesión dueña del hilo"""
+        self.last_seen = time.monotonic()
+
+    def is_idle(self):
+        return time.monotonic() - self.last_seen > self.idle_timeout
+
+    def is_alive(self):
+        return self.thread.is_alive()
+
+    def take_pending(self):
+        """Devuelve (remoto alineado, diff) pendiente de aplicar, o None"""
+        with self.lock:
+            pending, self.pending = self.pending, None
+        return pending
+
+    def ack(self, remote):
+        """Marca `remote` como la última versión sincronizada"""
+        with self.lock:
+            self.baseline = remote
+
+    async def check_once(self):
+        loop = asyncio.get_running_loop()
+        content = await loop.run_in_executor(None, fetch_sheet_bytes, self.url, self.fetch)
+        digest = hashlib.sha256(content).hexdigest()
+        if digest == self.last_digest:
+            return
+        remote = await loop.run_in_executor(
+            None, lambda: pd.read_excel(io.BytesIO(content), sheet_name=self.sheet))
+        with self.lock:
+            baseline = self.baseline
+        aligned = align_remote(baseline, remote)
+        diff = diff_season(baseline, aligned)
+        with self.lock:
+            self.last_digest = digest
+            if diff_has_changes(diff):
+                self.pending = (aligned, diff)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self._stop.is_set():
+            if self.is_idle():
+                break
+            try:
+                await self.check_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+            self.last_check = datetime.now().strftime('%H:%M:%S')
+            await loop.run_in_executor(None, self._stop.wait, self.interval)
+
+@st.cache_resource
+def get_sync_registry():
+    """Hilos de sincronización vivos del proceso, de todas las sesiones"""
+    return {'lock': threading.Lock(), 'workers': set()}
+
+def register_sync_worker(worker):
+    """Registra un hilo nuevo y detiene los de sesiones abandonadas"""
+    registry = get_sync_registry()
+    with registry['lock']:
+        for other in list(registry['workers']):
+            if other.is_idle():
+                other.stop()
+            if not other.is_alive():
+                registry['workers'].discard(other)
+        registry['workers'].add(worker)
+
+def apply_sync_result(log, remote, diff):
+    """Aplica un diff remoto, guarda la nueva base y acumula los conflictos en la sesión"""
+    conflicts = apply_remote_diff(log, diff)
+    st.session_state.sync_baseline = remote
+    worker = st.session_state.get('sync_worker')
+    if worker is not None:
+        worker.ack(remote)
+    if conflicts:
+        st.session_state.sync_conflicts = st.session_state.get('sync_conflicts', []) + conflicts
+    return conflicts
+
+def sync_now(log, excel_file, sheet):
+    """Sincronización puntual: compara el libro descargado y aplica solo lo que cambió"""
+    baseline = st.session_state.get('sync_baseline', log.base)
+    remote = align_remote(baseline, pd.read_excel(excel_file, sheet_name=sheet))
+    diff = diff_season(baseline, remote)
+    if diff_has_changes(diff):
+        apply_sync_result(log, remote, diff)
+    return diff
+
+def stop_sync_worker():
+    worker = st.session_state.pop('sync_worker', None)
+    if worker is not None:
+        worker.stop()
+
+def process_sync_updates(log):
+    """Recoge en el rerun los cambios que haya preparado el hilo de sincronización"""
+    worker = st.session_state.get('sync_worker')
+    if worker is None:
+        return
+    worker.touch()
+    pending = worker.take_pending()
+    if pending is not None:
+        remote, diff = pending
+        conflicts = apply_sync_result(log, remote, diff)
+        st.toast(f"🔄 Google Sheets: {len(diff['changed'])} modificados, {len(diff['added'])} altas, "
+                 f"{len(diff['removed'])} bajas ({len(conflicts)} conflictos)")
+
+def show_sync_panel(log):
+    """Controles de sincronización de la temporada cargada desde Google Sheets"""
+    url = st.session_state.get('season_sheets_url')
+    if url is None or not has_permission('upload'):
+        return
+
+    st.markdown("---")
+    st.header("🔁 Sincronización")
+    sheet = st.session_state.get('current_sheet')
+
+    if st.button("🔄 Sincronizar ahora"):
+        with st.spinner("Comparando con Google Sheets..."):
+            try:
+                diff = sync_now(log, load_google_sheets(url), sheet)
+                st.success(f"✅ {len(diff['changed'])} modificados, {len(diff['added'])} altas, "
+                           f"{len(diff['removed'])} bajas")
+            except Exception as e:
+                st.error(f"❌ Error al sincronizar: {str(e)}")
+
+    worker = st.session_state.get('sync_worker')
+    interval = st.number_input("Intervalo (segundos)", min_value=10, max_value=3600,
+                               value=worker.interval if worker else SYNC_INTERVAL, step=10)
+    auto = st.checkbox("Sincronización automática", value=worker is not None)
+
+    if auto and (worker is None or worker.interval != interval or not worker.is_alive()):
+        stop_sync_worker()
+        worker = SheetsSyncWorker(url, sheet, st.session_state.get('sync_baseline', log.base), interval)
+        worker.start()
+        register_sync_worker(worker)
+        st.session_state.sync_worker = worker
+    elif not auto and worker is not None:
+        stop_sync_worker()
+        worker = None
+
+    if worker is not None:
+        status = f"Última consulta: {worker.last_check or '—'}"
+        st.caption(status + (f" · ⚠️ {worker.last_error}" if worker.last_error else ""))
+
+def show_sync_conflicts(log):
+    """Conflictos entre ediciones locales y cambios remotos"""
+    conflicts = st.session_state.get('sync_conflicts')
+    if not conflicts:
+        return
+
+    st.warning(f"⚠️ {len(conflicts)} conflictos entre tus cambios y Google Sheets (se mantiene tu versión)")
+    with st.expander("🔀 Resolver conflictos"):
+        st.dataframe(pd.DataFrame(conflicts).astype(str), use_container_width=True)
+        col_remote, col_local = st.columns(2)
+        with col_remote:
+            if st.button("☁️ Aceptar versión remota"):
+                changed = {}
+                for conflict in conflicts:
+                    if conflict['Columna'] != '(fila)' and log.contains(conflict[ID_COL]):
+                        changed.setdefault(conflict[ID_COL], {})[conflict['Columna']] = conflict['Remoto']
+                if changed:
+                    log.record_sync(changed)
+                st.session_state.sync_conflicts = []
+                st.rerun()
+        with col_local:
+            if st.button("💻 Mantener mis cambios"):
+                st.session_state.sync_conflicts = []
+                st.rerun()
+
+# ============== ANÁLISIS DE PROGRESIÓN ==============
+
+# Horizonte de la proyección y tope de mejora proyectada sobre la mejor marca
+PROJECTION_DAYS = 180
+MAX_PROJECTED_GAIN = 0.05
+MIN_PROJECTION_POINTS = 3
+
+# Mínimo de nadadores de la misma edad, sexo y prueba para el índice por edad
+AGE_PEER_MIN = 5
+
+def season_start_year(sheet):
+    """Año de inicio de la temporada a partir del nombre de la hoja ("2024-2025" → 2024)"""
+    match = re.search(r'(?:19|20)\d{2}', str(sheet))
+    return int(match.group()) if match else None
+
+def season_order(sheet_names):
+    """Hojas ordenadas cronológicamente (las que no tienen año, en su orden original)"""
+    positions = {sheet: i for i, sheet in enumerate(sheet_names)}
+    return sorted(sheet_names, key=lambda sheet: (season_start_year(sheet) or 0, positions[sheet]))
+
+def format_centesimas(centesimas):
+    """Centésimas a texto mm:ss.cc (vectorizado)"""
+    valid = centesimas.notna()
+    values = centesimas.fillna(0).round().astype(int)
+    text = ((values // 6000).map('{:02d}'.format) + ":"
+            + ((values % 6000) / 100).map('{:05.2f}'.format))
+    return text.where(valid)
+
+def season_history_long(df, sheet, order, key_to_id):
+    """Marcas de una temporada en formato largo, en centésimas equivalentes de 50m.
+
+    Los nadadores se identifican con el IdNadador de la temporada activa
+    (por IdNadador o por nombre|año|sexo); los que ya no están conservan
+    una clave propia que empieza por "~".
+    """
+    keys = swimmer_key(df)
+    ids = keys.map(key_to_id)
+    if ID_COL in df.columns:
+        own = df[ID_COL].astype(str)
+        ids = own.where(own.isin(set(key_to_id.values())), ids)
+    ids = ids.fillna("~" + keys)
+
+    long = season_times_long(df.assign(**{ID_COL: ids.values}))
+    if long.empty:
+        return long
+
+    unique = ~ids.duplicated().values
+    attrs = pd.DataFrame({
+        'Nombre': df['Nombre'].values[unique],
+        'Sexo': df['Sexo'].fillna('').astype(str).str.strip().str.upper().values[unique],
+        'AñoNacimiento': birth_years(df).values[unique]
+    }, index=ids.values[unique])
+    long = long.join(attrs, on=ID_COL)
+
+    pool = arrow_to_series(arrow_text(long['Piscina'].fillna('')), long.index)
+    long['Centesimas'] = to_long_course(times_to_centesimas(long['Tiempo']), long['Prueba'], pool)
+    fecha = pd.to_datetime(long['Fecha'], errors='coerce', dayfirst=True, format='mixed')
+    year = season_start_year(sheet)
+    if year is not None:
+        # Sin fecha: mitad de temporada
+        fecha = fecha.fillna(pd.Timestamp(year + 1, 1, 1))
+    long['Fecha'] = fecha
+    long['Temporada'] = sheet
+    long['Orden'] = order
+    return long.dropna(subset=['Centesimas']).drop(columns=['Tiempo', 'Piscina'])
+
+def build_progression(history):
+    """Mejora, mejor marca acumulada, proyección e índice por edad de todo el club.
+
+    `history` son las marcas de todas las temporadas (season_history_long).
+    Devuelve el historial ordenado con la mejor acumulada y un resumen por
+    (IdNadador, Prueba). Todo con operaciones de grupo vectorizadas.
+    """
+    group = [ID_COL, 'Prueba']
+    hist = history.sort_values(group + ['Fecha', 'Orden'], kind='mergesort', na_position='last')
+    hist = hist.reset_index(drop=True)
+    hist['Edad'] = hist['Fecha'].dt.year - hist['AñoNacimiento']
+    hist['MejorAcumulada'] = hist.groupby(group, sort=False)['Centesimas'].cummin()
+
+    # Mejor marca de cada temporada y comparación con la anterior
+    # (ordenar y quedarse con la primera fila: idxmin por grupos no está vectorizado en pandas)
+    season_best = hist.sort_values(group + ['Orden', 'Centesimas'], kind='mergesort')
+    season_best = season_best.drop_duplicates(group + ['Orden'])
+    by_swimmer = season_best.groupby(group, sort=False)['Centesimas']
+    season_best = season_best.assign(Anterior=by_swimmer.shift())
+
+    # Índice por edad: mediana de los mejores de su edad, sexo y prueba / marca del nadador
+    peers = season_best.groupby(['Prueba', 'Sexo', 'Edad'])['Centesimas']
+    peer_median = peers.transform('median').where(peers.transform('count') >= AGE_PEER_MIN)
+    season_best['IndiceEdad'] = peer_median / season_best['Centesimas'] * 100
+
+    last = season_best.groupby(group, sort=False).tail(1).set_index(group)
+    first = season_best.groupby(group, sort=False).head(1).set_index(group)
+    grouped = hist.groupby(group, sort=False)
+    best = grouped['Centesimas'].min()
+
+    # Tendencia: regresión de log(tiempo) frente a años, por nadador y prueba
+    dated = hist[hist['Fecha'].notna()]
+    x = (dated['Fecha'] - pd.Timestamp(2000, 1, 1)).dt.days / 365.25
+    y = np.log(dated['Centesimas'])
+    keys = [dated[ID_COL], dated['Prueba']]
+    dx = x - x.groupby(keys).transform('mean')
+    dy = y - y.groupby(keys).transform('mean')
+    sums = pd.DataFrame({'sxy': dx * dy, 'sxx': dx * dx, 'n': 1, 'x': x, 'y': y}).groupby(keys)
+    fit = sums.agg({'sxy': 'sum', 'sxx': 'sum', 'n': 'sum', 'x': ['mean', 'max'], 'y': 'mean'})
+    fit.columns = ['sxy', 'sxx', 'n', 'x_mean', 'x_last', 'y_mean']
+    fit.index.names = group
+    fit = fit[(fit['n'] >= MIN_PROJECTION_POINTS) & (fit['sxx'] > 0)]
+    slope = fit['sxy'] / fit['sxx']
+    target = fit['x_last'] + PROJECTION_DAYS / 365.25
+    projection = np.exp(fit['y_mean'] + slope * (target - fit['x_mean']))
+    projection = projection.clip(lower=best.reindex(projection.index) * (1 - MAX_PROJECTED_GAIN))
+
+    summary = pd.DataFrame({
+        'Nombre': grouped['Nombre'].last(),
+        'Sexo': grouped['Sexo'].last(),
+        'Temporadas': season_best.groupby(group, sort=False).size(),
+        'Marcas': grouped.size(),
+        'Mejor': best,
+        'Primera': first['Centesimas'],
+        'Ultima': last['Centesimas'],
+        'MejoraTotal': (first['Centesimas'] - best) / first['Centesimas'] * 100,
+        'MejoraTemporada': (last['Anterior'] - last['Centesimas']) / last['Anterior'] * 100,
+        'RitmoAnual': -(np.exp(slope) - 1) * 100,
+        'Proyeccion': projection,
+        'IndiceEdad': last['IndiceEdad']
+    })
+    return {'history': hist, 'summary': summary.reset_index()}
+
+def progression_display(summary):
+    """Resumen de progresión con tiempos legibles y porcentajes redondeados"""
+    display_df = summary[[ID_COL, 'Nombre', 'Sexo', 'Prueba', 'Temporadas', 'Marcas']].copy()
+    display_df['Mejor (50m)'] = format_centesimas(summary['Mejor'])
+    display_df['Mejora total %'] = summary['MejoraTotal'].round(1)
+    display_df['Mejora temporada %'] = summary['MejoraTemporada'].round(1)
+    display_df['Ritmo %/año'] = summary['RitmoAnual'].round(1)
+    display_df['Proyección'] = format_centesimas(summary['Proyeccion'])
+    display_df['Índice edad'] = summary['IndiceEdad'].round(0)
+    return display_df
+
+def get_season_frame(log, sheet):
+    """Hoja de la fuente cargada; la temporada activa, con sus ediciones (las demás se leen una vez por carga)"""
+    if sheet == st.session_state.get('current_sheet'):
+        return log.view()
+    return render_cache_get(('hoja', log.id, sheet),
+                            lambda: read_season(st.session_state.season_source, sheet))
+
+def get_history_seasons(log):
+    """Marcas de las demás temporadas de la fuente cargada (se leen una vez por carga)"""
+    def build():
+        source = st.session_state.get('season_source')
+        current = st.session_state.get('current_sheet')
+        if source is None:
+            return []
+        key_to_id = dict(zip(swimmer_key(log.base), log.base[ID_COL]))
+        frames = []
+        for order, sheet in enumerate(season_order(list(source.sheet_names))):
+            if sheet != current:
+                frames.append(season_history_long(get_season_frame(log, sheet), sheet, order, key_to_id))
+        return frames
+
+    return render_cache_get(('historial', log.id), build)
+
+def get_progression(log):
+    """Análisis de progresión de todo el club, cacheado por versión de los datos"""
+    def build():
+        df = log.view()
+        current = st.session_state.get('current_sheet', 'Temporada')
+        source = st.session_state.get('season_source')
+        sheets = season_order(list(source.sheet_names)) if source is not None else [current]
+        order = sheets.index(current) if current in sheets else len(sheets)
+        key_to_id = dict(zip(swimmer_key(df), df[ID_COL]))
+
+        frames = [f for f in get_history_seasons(log) + [season_history_long(df, current, order, key_to_id)]
+                  if not f.empty]
+        if not frames:
+            return None
+        progression = build_progression(pd.concat(frames, ignore_index=True))
+        progression['display'] = progression_display(progression['summary'])
+        return progression
+
+    return render_cache_get(('progresion', log.key), build)
+
+def show_progression_chart(progression, swimmer_id, prueba):
+    """Evolución de un nadador en una prueba, con la mejor acumulada y la proyección"""
+    hist = progression['history']
+    rows = hist[(hist[ID_COL] == swimmer_id) & (hist['Prueba'] == prueba) & hist['Fecha'].notna()]
+    if rows.empty:
+        st.info("Sin marcas con fecha en esta prueba")
+        return
+
+    chart = pd.DataFrame({
+        'Marca (s)': rows['Centesimas'].values / 100,
+        'Mejor acumulada (s)': rows['MejorAcumulada'].values / 100
+    }, index=rows['Fecha'].values)
+
+    summary = progression['summary']
+    projected = summary.loc[(summary[ID_COL] == swimmer_id) & (summary['Prueba'] == prueba), 'Proyeccion']
+    if len(projected) and pd.notna(projected.iloc[0]):
+        future = rows['Fecha'].max() + pd.Timedelta(days=PROJECTION_DAYS)
+        chart.loc[future, 'Proyección (s)'] = projected.iloc[0] / 100
+        chart.loc[rows['Fecha'].max(), 'Proyección (s)'] = rows['MejorAcumulada'].iloc[-1] / 100
+    st.line_chart(chart.groupby(level=0).min())
+
+def show_progression_dashboard(log):
+    """Panel del entrenador: progresión de todo el club y detalle por nadador"""
+    st.header("📈 Progresión de Nadadores")
+    st.caption("Tiempos equivalentes en piscina de 50m, comparando todas las temporadas del archivo")
+
+    progression = get_progression(log)
+    if progression is None:
+        st.info("No hay tiempos registrados para analizar")
+        return
+
+    display_df = progression['display']
+    col_event, col_sex, col_scope = st.columns([2, 1, 1])
+    with col_event:
+        events = [prueba for prueba in PRUEBAS if prueba in set(display_df['Prueba'])]
+        event = st.selectbox("Prueba", ["Todas"] + events, key="progression_event")
+    with col_sex:
+        sex = st.selectbox("Sexo", ["Todos", "M", "F"], key="progression_sex")
+    with col_scope:
+        only_current = st.checkbox("Solo temporada activa", value=True)
+
+    def build_filtered():
+        mask = pd.Series(True, index=display_df.index)
+        if event != "Todas":
+            mask &= display_df['Prueba'] == event
+        if sex != "Todos":
+            mask &= display_df['Sexo'] == sex
+        if only_current:
+            mask &= ~display_df[ID_COL].str.startswith("~")
+        return display_df[mask].sort_values('Mejora temporada %', ascending=False, na_position='last')
+
+    shown = render_cache_get(('progresion_filtro', log.key, event, sex, only_current), build_filtered)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("🏊 Marcas con varias temporadas", int((shown['Temporadas'] > 1).sum()))
+    with col2:
+        improving = shown['Mejora temporada %'] > 0
+        st.metric("📈 Mejoran respecto a la anterior", int(improving.sum()))
+    with col3:
+        average = shown['Mejora temporada %'].mean()
+        st.metric("📊 Mejora media", f"{average:.1f}%" if pd.notna(average) else "—")
+
+    st.dataframe(shown.head(1000), use_container_width=True, hide_index=True)
+    if len(shown) > 1000:
+        st.info(f"... mostrando 1000 de {len(shown)} marcas")
+
+    if shown.empty:
+        return
+
+    # Detalle de un nadador: por defecto el seleccionado en la gestión
+    st.subheader("🔍 Evolución por nadador")
+    swimmer_ids = list(dict.fromkeys(shown[ID_COL].head(1000)))
+    selected = st.session_state.get('selected_swimmer_id')
+    if selected in set(shown[ID_COL]) and selected not in swimmer_ids:
+        swimmer_ids.insert(0, selected)
+    names = dict(zip(shown[ID_COL], shown['Nombre']))
+    swimmer_id = st.selectbox("Nadador", swimmer_ids, format_func=lambda i: str(names.get(i, i)),
+                              index=swimmer_ids.index(selected) if selected in swimmer_ids else 0,
+                              key="progression_swimmer")
+    swimmer_rows = display_df[display_df[ID_COL] == swimmer_id]
+    st.dataframe(swimmer_rows.drop(columns=[ID_COL, 'Nombre', 'Sexo']), use_container_width=True, hide_index=True)
+
+    chart_event = st.selectbox("Prueba del gráfico", list(swimmer_rows['Prueba']), key="progression_chart_event")
+    show_progression_chart(progression, swimmer_id, chart_event)
+
+# ============== CATEGORÍAS POR EDAD ==============
+
+# Categorías federativas por sexo y edad. La edad es la que se cumple en el año
+# en que termina la temporada ("2024-2025" → 2025). Se pueden sustituir con un
+# JSON con la misma estructura (EdadMax null = sin límite; Sexo "" = ambos).
+CATEGORIES_FILE = os.environ.get("NADADORES_CATEGORIAS_FILE", "")
+DEFAULT_CATEGORY_RULES = [
+    {'Categoria': 'Benjamín', 'Sexo': 'M', 'EdadMin': 0, 'EdadMax': 11},
+    {'Categoria': 'Benjamín', 'Sexo': 'F', 'EdadMin': 0, 'EdadMax': 10},
+    {'Categoria': 'Alevín', 'Sexo': 'M', 'EdadMin': 12, 'EdadMax': 13},
+    {'Categoria': 'Alevín', 'Sexo': 'F', 'EdadMin': 11, 'EdadMax': 12},
+    {'Categoria': 'Infantil', 'Sexo': 'M', 'EdadMin': 14, 'EdadMax': 15},
+    {'Categoria': 'Infantil', 'Sexo': 'F', 'EdadMin': 13, 'EdadMax': 14},
+    {'Categoria': 'Junior', 'Sexo': 'M', 'EdadMin': 16, 'EdadMax': 18},
+    {'Categoria': 'Junior', 'Sexo': 'F', 'EdadMin': 15, 'EdadMax': 17},
+    {'Categoria': 'Absoluto', 'Sexo': 'M', 'EdadMin': 19, 'EdadMax': None},
+    {'Categoria': 'Absoluto', 'Sexo': 'F', 'EdadMin': 18, 'EdadMax': None},
+]
+CATEGORY_AGE_OFFSET = 1
+NO_CATEGORY = "Sin categoría"
+
+@st.cache_resource
+def load_category_rules(path):
+    """Reglas de categorías del archivo `path` (o las de por defecto), compartidas entre sesiones"""
+    if not path:
+        return DEFAULT_CATEGORY_RULES
+    with open(path, 'r', encoding='utf-8') as f:
+        rules = json.load(f)
+    for rule in rules:
+        missing = {'Categoria', 'EdadMin'} - set(rule)
+        if missing:
+            raise ValueError(f"Regla de categoría sin {', '.join(sorted(missing))}: {rule}")
+    return rules
+
+def get_category_rules():
+    try:
+        return load_category_rules(CATEGORIES_FILE)
+    except (OSError, ValueError) as e:
+        st.warning(f"⚠️ No se pudieron leer las categorías de '{CATEGORIES_FILE}' ({e}); se usan las de por defecto")
+        return DEFAULT_CATEGORY_RULES
+
+def category_names(rules):
+    """Categorías en el orden de la tabla de reglas, sin repetir"""
+    return list(dict.fromkeys(rule['Categoria'] for rule in rules)) + [NO_CATEGORY]
+
+def season_reference_year(sheet):
+    """Año en el que se calcula la edad de la temporada (el actual si la hoja no tiene año)"""
+    year = season_start_year(sheet)
+    return year + CATEGORY_AGE_OFFSET if year is not None else datetime.now().year
+
+def assign_categories(df, rules, reference_year):
+    """Edad y categoría de todos los nadadores en una pasada vectorizada (una máscara por regla)"""
+    years = pd.to_numeric(df['AñoNacimiento'], errors='coerce') if 'AñoNacimiento' in df.columns \
+        else pd.Series(np.nan, index=df.index)
+    ages = reference_year - years
+    sexes = df['Sexo'].fillna('').astype(str).str.strip().str.upper() if 'Sexo' in df.columns \
+        else pd.Series('', index=df.index)
+
+    conditions = []
+    for rule in rules:
+        mask = ages >= rule['EdadMin']
+        if rule.get('EdadMax') is not None:
+            mask &= ages <= rule['EdadMax']
+        if rule.get('Sexo'):
+            mask &= sexes == rule['Sexo']
+        conditions.append(mask.to_numpy())
+
+    labels = np.select(conditions, [rule['Categoria'] for rule in rules], default=NO_CATEGORY)
+    return pd.DataFrame({
+        'Edad': ages.round().astype('Int64'),
+        'Categoría': pd.Categorical(labels, categories=category_names(rules), ordered=True)
+    }, index=df.index)
+
+def get_season_categories(log):
+    """Edad y categoría de la temporada activa, calculadas una vez por versión"""
+    sheet = st.session_state.get('current_sheet')
+    return render_cache_get(('categorias', log.key, sheet),
+                            lambda: assign_categories(log.view(), get_category_rules(), season_reference_year(sheet)))
+
+def build_category_summary(df, categories, base_times):
+    """Nadadores, disponibles y mejores tiempos (equivalentes en 50m) por categoría y sexo"""
+    sexes = df['Sexo'].fillna('').astype(str).str.strip().str.upper()
+    available = df['Disponible'].fillna(False).astype(bool)
+    roster = pd.DataFrame({'Categoría': categories['Categoría'], 'Sexo': sexes, 'Disponible': available})
+    summary = roster.groupby(['Categoría', 'Sexo'], observed=True).agg(
+        Nadadores=('Disponible', 'size'), Disponibles=('Disponible', 'sum')).reset_index()
+
+    long = season_times_long(df)
+    if long.empty:
+        return {'summary': summary, 'best': pd.DataFrame(columns=['Categoría', 'Sexo', 'Prueba', 'Nadador', 'Tiempo (50m)',
+                                                                  'Puntos FINA'])}
+
+    pools = arrow_to_series(arrow_text(long['Piscina'].fillna('')), long.index)
+    long['Centesimas'] = to_long_course(times_to_centesimas(long['Tiempo']), long['Prueba'], pools)
+    by_id = roster.assign(Nombre=df['Nombre'].values).set_index(df[ID_COL].values)
+    long = long.dropna(subset=['Centesimas']).join(by_id[['Categoría', 'Sexo', 'Nombre']], on=ID_COL)
+
+    # Mejor marca de cada grupo: ordenar y quedarse con la primera (más rápido que idxmin)
+    best = (long.sort_values('Centesimas', kind='mergesort')
+                .drop_duplicates(['Categoría', 'Sexo', 'Prueba']))
+    order = {prueba: i for i, prueba in enumerate(PRUEBAS)}
+    best = best.assign(Orden=best['Prueba'].map(order)).sort_values(['Categoría', 'Sexo', 'Orden'])
+    return {
+        'summary': summary,
+        'best': pd.DataFrame({
+            'Categoría': best['Categoría'].values,
+            'Sexo': best['Sexo'].values,
+            'Prueba': best['Prueba'].values,
+            'Nadador': best['Nombre'].values,
+            'Tiempo (50m)': format_centesimas(best['Centesimas']).values,
+            'Puntos FINA': fina_points(best['Centesimas'], best['Prueba'], best['Sexo'],
+                                       pd.Series('50m', index=best.index), base_times).astype('Int64').values
+        })
+    }
+
+def get_category_summary(log):
+    """Resumen por categoría, cacheado por versión"""
+    sheet = st.session_state.get('current_sheet')
+    return render_cache_get(('resumen_categorias', log.key, sheet),
+                            lambda: build_category_summary(log.view(), get_season_categories(log), get_base_times()))
+
+def show_category_summary(log):
+    """Nadadores y mejores marcas por categoría"""
+    summary = get_category_summary(log)
+    with st.expander("🏷️ Resumen por categoría"):
+        st.caption(f"Edad a 31 de diciembre de {season_reference_year(st.session_state.get('current_sheet'))}")
+        st.dataframe(summary['summary'], use_container_width=True, hide_index=True)
+
+        best = summary['best']
+        if best.empty:
+            return
+        # Ya viene ordenado por categoría
+        category = st.selectbox("Mejores marcas de la categoría", list(best['Categoría'].unique()), key="category_best")
+        st.dataframe(best[best['Categoría'] == category].drop(columns='Categoría'),
+                     use_container_width=True, hide_index=True)
+
+# ============== PUNTUACIÓN FINA ==============
+
+# Tiempos base (récords del mundo aproximados) por piscina, sexo y prueba. Se
+# pueden sustituir con un JSON con la misma estructura en NADADORES_BASE_TIMES_FILE.
+# Pruebas sin tiempo base (p.ej. 3000m o 100m Estilos en 50m) no puntúan.
+BASE_TIMES_FILE = os.environ.get("NADADORES_BASE_TIMES_FILE", "")
+DEFAULT_BASE_TIMES = {
+    '50m': {
+        'M': {
+            "50m Libre": "00:20.91", "100m Libre": "00:46.40", "200m Libre": "01:42.00",
+            "400m Libre": "03:40.07", "800m Libre": "07:32.12", "1500m Libre": "14:30.67",
+            "50m Espalda": "00:24.00", "100m Espalda": "00:51.60", "200m Espalda": "01:51.92",
+            "50m Braza": "00:25.95", "100m Braza": "00:56.88", "200m Braza": "02:05.48",
+            "50m Mariposa": "00:22.27", "100m Mariposa": "00:49.45", "200m Mariposa": "01:50.34",
+            "200m Estilos": "01:54.00"
+        },
+        'F': {
+            "50m Libre": "00:23.61", "100m Libre": "00:51.71", "200m Libre": "01:52.23",
+            "400m Libre": "03:55.38", "800m Libre": "08:04.79", "1500m Libre": "15:20.48",
+            "50m Espalda": "00:26.86", "100m Espalda": "00:57.13", "200m Espalda": "02:03.14",
+            "50m Braza": "00:29.16", "100m Braza": "01:04.13", "200m Braza": "02:17.55",
+            "50m Mariposa": "00:24.43", "100m Mariposa": "00:54.60", "200m Mariposa": "02:01.81",
+            "200m Estilos": "02:06.12"
+        }
+    },
+    '25m': {
+        'M': {
+            "50m Libre": "00:19.90", "100m Libre": "00:44.84", "200m Libre": "01:39.37",
+            "400m Libre": "03:32.25", "800m Libre": "07:20.46", "1500m Libre": "14:06.88",
+            "50m Espalda": "00:22.11", "100m Espalda": "00:48.33", "200m Espalda": "01:45.63",
+            "50m Braza": "00:24.95", "100m Braza": "00:55.28", "200m Braza": "02:00.16",
+            "50m Mariposa": "00:21.32", "100m Mariposa": "00:47.71", "200m Mariposa": "01:46.85",
+            "100m Estilos": "00:49.28", "200m Estilos": "01:49.63"
+        },
+        'F': {
+            "50m Libre": "00:22.83", "100m Libre": "00:50.25", "200m Libre": "01:50.31",
+            "400m Libre": "03:50.25", "800m Libre": "07:57.42", "1500m Libre": "15:18.01",
+            "50m Espalda": "00:25.23", "100m Espalda": "00:54.02", "200m Espalda": "01:57.33",
+            "50m Braza": "00:28.37", "100m Braza": "01:02.36", "200m Braza": "02:12.50",
+            "50m Mariposa": "00:23.94", "100m Mariposa": "00:52.71", "200m Mariposa": "01:59.32",
+            "100m Estilos": "00:55.11", "200m Estilos": "02:01.63"
+        }
+    }
+}
+
+@st.cache_resource
+def load_base_times(path):
+    """Tiempos base en centésimas, indexados por (Prueba, Sexo, Piscina), compartidos entre sesiones"""
+    base = DEFAULT_BASE_TIMES
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            base = json.load(f)
+
+    rows = [(prueba, sexo, piscina, tiempo)
+            for piscina, by_sex in base.items()
+            for sexo, by_event in by_sex.items()
+            for prueba, tiempo in by_event.items()]
+    table = pd.DataFrame(rows, columns=['Prueba', 'Sexo', 'Piscina', 'Tiempo'])
+    table['Base'] = times_to_centesimas(table['Tiempo'])
+    if table['Base'].isna().any():
+        bad = table.loc[table['Base'].isna(), 'Prueba'].tolist()
+        raise ValueError(f"Tiempos base no válidos en: {', '.join(bad)}")
+    return table.set_index(['Prueba', 'Sexo', 'Piscina'])['Base']
+
+def get_base_times():
+    try:
+        return load_base_times(BASE_TIMES_FILE)
+    except (OSError, ValueError) as e:
+        st.warning(f"⚠️ No se pudieron leer los tiempos base de '{BASE_TIMES_FILE}' ({e}); se usan los de por defecto")
+        return load_base_times("")
+
+def fina_points(centesimas, pruebas, sexes, pools, base_times):
+    """Puntos FINA vectorizados: 1000 · (base / tiempo)³, truncados (NaN sin tiempo base)"""
+    keys = pd.MultiIndex.from_arrays([pruebas.values, sexes.values, pools.values])
+    base = base_times.reindex(keys).values
+    points = np.floor(1000 * (base / centesimas.where(centesimas > 0).values) ** 3)
+    return pd.Series(points, index=centesimas.index)
+
+def build_season_scores(df, base_times):
+    """Puntos FINA y percentil en el club de cada tiempo de la temporada.
+
+    Una fila por tiempo, en el mismo orden que season_times_long. El
+    percentil compara equivalentes en 50m dentro de (Prueba, Sexo):
+    100 = el más rápido del club.
+    """
+    long = season_times_long(df)
+    if long.empty:
+        return pd.DataFrame(columns=[ID_COL, 'Prueba', 'Puntos', 'Percentil'])
+
+    pools = arrow_to_series(arrow_text(long['Piscina'].fillna('')), long.index)
+    # Sin piscina se asume 50m, como en las equivalencias
+    pools = pools.where(pools == '25m', '50m')
+    sexes = long[ID_COL].map(pd.Series(
+        df['Sexo'].fillna('').astype(str).str.strip().str.upper().values, index=df[ID_COL].values))
+    centesimas = times_to_centesimas(long['Tiempo'])
+
+    percentil = (to_long_course(centesimas, long['Prueba'], pools)
+                 .groupby([long['Prueba'], sexes]).rank(ascending=False, pct=True) * 100)
+    return pd.DataFrame({
+        ID_COL: long[ID_COL].values,
+        'Prueba': long['Prueba'].values,
+        'Puntos': fina_points(centesimas, long['Prueba'], sexes, pools, base_times).astype('Int64').values,
+        'Percentil': percentil.round().astype('Int64').values
+    })
+
+def get_season_scores(log):
+    """Puntuaciones de la temporada, calculadas una vez por versión"""
+    return render_cache_get(('puntuaciones', log.key), lambda: build_season_scores(log.view(), get_base_times()))
+
+def swimmer_scores(df, scores):
+    """Mejor puntuación FINA y mejor percentil de cada nadador, alineados con `df`"""
+    best = scores.groupby(ID_COL)[['Puntos', 'Percentil']].max()
+    return best.reindex(df[ID_COL].values).set_axis(df.index)
+
+# ============== OPTIMIZADOR DE INSCRIPCIONES ==============
+
+# Puntos por puesto en una competición (1º, 2º, ...)
+MEET_POINTS = [9, 7, 6, 5, 4, 3, 2, 1]
+
+# Límites habituales de inscripción
+DEFAULT_MAX_EVENTS = 3
+DEFAULT_MAX_PER_EVENT = 2
+
+def meet_best_times(df, pool):
+    """Mejor tiempo de cada nadador disponible por prueba, convertido a la piscina de la competición"""
+    long = season_times_long(df)
+    if long.empty:
+        return pd.DataFrame(columns=[ID_COL, 'Prueba', 'Sexo', 'Centesimas'])
+
+    pools = arrow_to_series(arrow_text(long['Piscina'].fillna('')), long.index)
+    long['Centesimas'] = to_pool(times_to_centesimas(long['Tiempo']), long['Prueba'], pools, pool)
+    long['Sexo'] = long[ID_COL].map(pd.Series(
+        df['Sexo'].fillna('').astype(str).str.strip().str.upper().values, index=df[ID_COL].values))
+    available = set(df.loc[df['Disponible'].fillna(False).astype(bool), ID_COL])
+    long = long[long[ID_COL].isin(available)].dropna(subset=['Centesimas'])
+    best = long.groupby([ID_COL, 'Prueba', 'Sexo'], sort=False)['Centesimas'].min()
+    return best.reset_index()
+
+def default_points_table(best):
+    """Tabla de tiempos esperados por puesto a partir de los cuantiles del club.
+
+    Una fila por prueba y sexo; la columna "Nº" es el tiempo con el que se
+    espera quedar en ese puesto o mejor. Pensada para sustituirla con
+    resultados reales de la competición.
+    """
+    places = [f"{i + 1}º" for i in range(len(MEET_POINTS))]
+    quantiles = [(i + 1) / (len(MEET_POINTS) + 1) for i in range(len(MEET_POINTS))]
+    if best.empty:
+        return pd.DataFrame(columns=['Prueba', 'Sexo'] + places)
+
+    table = best.groupby(['Prueba', 'Sexo'])['Centesimas'].quantile(quantiles).unstack()
+    table.columns = places
+    order = {prueba: i for i, prueba in enumerate(PRUEBAS)}
+    table = table.reset_index().sort_values(['Prueba', 'Sexo'], key=lambda col: col.map(order) if col.name == 'Prueba' else col)
+    for place in places:
+        table[place] = format_centesimas(table[place])
+    return table.reset_index(drop=True)
+
+def expected_points(best, points_table):
+    """Puntos esperados de cada (nadador, prueba) según la tabla de tiempos por puesto"""
+    places = list(points_table.columns[2:])
+    thresholds = points_table.melt(id_vars=['Prueba', 'Sexo'], value_vars=places, var_name='Puesto', value_name='Tiempo')
+    thresholds['Limite'] = times_to_centesimas(thresholds['Tiempo'].astype(str).where(thresholds['Tiempo'].notna()))
+    thresholds['Puntos'] = thresholds['Puesto'].map(dict(zip(places, MEET_POINTS)))
+    thresholds = thresholds.dropna(subset=['Limite'])
+
+    # Mejor puesto alcanzable: el de más puntos cuyo tiempo límite se iguala o mejora
+    merged = best.reset_index().merge(thresholds[['Prueba', 'Sexo', 'Limite', 'Puntos']], on=['Prueba', 'Sexo'])
+    merged = merged[merged['Centesimas'] <= merged['Limite']]
+    points = merged.groupby('index')['Puntos'].max()
+    return pd.Series(points, index=best.index).fillna(0)
+
+def max_weight_entries(edges, max_events, max_per_event):
+    """Asignación nadador→prueba de peso máximo con límites por nadador y por prueba.
+
+    `edges` es una lista de (nadador, prueba, peso entero > 0). Se resuelve
+    como flujo de coste mínimo (caminos más cortos sucesivos con Dijkstra y
+    potenciales), deteniéndose cuando ningún camino aumenta el peso total.
+    Devuelve los índices de `edges` elegidos.
+    """
+    swimmers = list(dict.fromkeys(edge[0] for edge in edges))
+    events = list(dict.fromkeys(edge[1] for edge in edges))
+    source, sink = 0, 1
+    node = {('s', swimmer): 2 + i for i, swimmer in enumerate(swimmers)}
+    node.update({('e', event): 2 + len(swimmers) + i for i, event in enumerate(events)})
+    n = 2 + len(swimmers) + len(events)
+
+    # Aristas en listas paralelas: destino, capacidad, coste; la inversa es i ^ 1
+    graph = [[] for _ in range(n)]
+    to, cap, cost = [], [], []
+
+    def add_edge(u, v, capacity, weight):
+        graph[u].append(len(to)); to.append(v); cap.append(capacity); cost.append(weight)
+        graph[v].append(len(to)); to.append(u); cap.append(0); cost.append(-weight)
+
+    for swimmer in swimmers:
+        add_edge(source, node[('s', swimmer)], max_events, 0)
+    entry_edges = []
+    for swimmer, event, weight in edges:
+        entry_edges.append(len(to))
+        add_edge(node[('s', swimmer)], node[('e', event)], 1, -weight)
+    for event in events:
+        add_edge(node[('e', event)], sink, max_per_event, 0)
+
+    # Potenciales iniciales: el grafo es un DAG de tres capas
+    potential = [0] * n
+    for u in range(2, 2 + len(swimmers)):
+        for e in graph[u]:
+            if cap[e] > 0:
+                potential[to[e]] = min(potential[to[e]], cost[e])
+    potential[sink] = min(potential[2 + len(swimmers):] or [0])
+
+    inf = float('inf')
+    while True:
+        dist = [inf] * n
+        parent = [-1] * n
+        dist[source] = 0
+        heap = [(0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            for e in graph[u]:
+                if cap[e] > 0:
+                    v = to[e]
+                    nd = d + cost[e] + potential[u] - potential[v]
+                    if nd < dist[v]:
+                        dist[v] = nd
+                        parent[v] = e
+                        heapq.heappush(heap, (nd, v))
+        if dist[sink] == inf:
+            break
+        # Coste real del camino; si no es negativo ya no suma puntos
+        if dist[sink] + potential[sink] - potential[source] >= 0:
+            break
+        for v in range(n):
+            potential[v] += min(dist[v], dist[sink])
+        v = sink
+        while v != source:
+            e = parent[v]
+            cap[e] -= 1
+            cap[e ^ 1] += 1
+            v = to[e ^ 1]
+
+    return [i for i, e in enumerate(entry_edges) if cap[e] == 0]
+
+def optimize_meet_entries(best, points, max_events, max_per_event, fill_entries=False):
+    """Inscripciones que maximizan la puntuación esperada del equipo.
+
+    Con `fill_entries`, las plazas libres se completan con los mejores
+    tiempos aunque no sumen puntos (peso mínimo, nunca a costa de puntos).
+    """
+    weight = (points * 100).round().astype(int)
+    if fill_entries:
+        # Desempate por rapidez relativa dentro de la prueba, siempre < 1 punto
+        rank = best.groupby(['Prueba', 'Sexo'])['Centesimas'].rank(pct=True)
+        weight = weight + ((1 - rank) * 50).round().astype(int) + 1
+    candidates = best.assign(Puntos=points, Peso=weight)
+    candidates = candidates[candidates['Peso'] > 0]
+
+    events = candidates['Prueba'] + "|" + candidates['Sexo']
+    edges = list(zip(candidates[ID_COL], events, candidates['Peso']))
+    chosen = max_weight_entries(edges, max_events, max_per_event)
+    return candidates.iloc[chosen].drop(columns='Peso')
+
+def get_meet_candidates(log, pool, category="Todas"):
+    """Mejores tiempos por prueba en la piscina de la competición (cacheados por versión y categoría)"""
+    best = render_cache_get(('convocatoria', log.key, pool), lambda: meet_best_times(log.view(), pool))
+    if category == "Todas":
+        return best
+
+    def build():
+        df = log.view()
+        in_category = set(df.loc[get_season_categories(log)['Categoría'] == category, ID_COL])
+        return best[best[ID_COL].isin(in_category)].reset_index(drop=True)
+
+    return render_cache_get(('convocatoria', log.key, pool, st.session_state.get('current_sheet'), category), build)
+
+def get_meet_fina_points(log, pool, category, best):
+    """Puntos FINA de los candidatos en la piscina de la competición (cacheados por versión)"""
+    return render_cache_get(
+        ('fina_convocatoria', log.key, pool, st.session_state.get('current_sheet'), category),
+        lambda: fina_points(best['Centesimas'], best['Prueba'], best['Sexo'], pd.Series(pool, index=best.index),
+                            get_base_times()).fillna(0))
+
+def show_meet_optimizer(log):
+    """Propuesta de inscripciones para una competición"""
+    st.header("🏅 Optimizador de Inscripciones")
+    st.caption("Elige qué nadadores disponibles nadan cada prueba para maximizar los puntos esperados")
+
+    col_pool, col_category, col_events, col_entries = st.columns(4)
+    with col_pool:
+        pool = st.selectbox("🏊 Piscina de la competición", ['25m', '50m'], index=1, key="meet_pool")
+    with col_category:
+        category = st.selectbox("🏷️ Categoría", ["Todas"] + category_names(get_category_rules()), key="meet_category")
+    with col_events:
+        max_events = st.number_input("Máx. pruebas por nadador", min_value=1, max_value=len(PRUEBAS),
+                                     value=DEFAULT_MAX_EVENTS)
+    with col_entries:
+        max_per_event = st.number_input("Máx. nadadores del club por prueba", min_value=1, max_value=20,
+                                        value=DEFAULT_MAX_PER_EVENT)
+
+    best = get_meet_candidates(log, pool, category)
+    if best.empty:
+        st.info("No hay nadadores disponibles con tiempos registrados")
+        return
+
+    objective = st.radio("🎯 Objetivo", ["Puestos en la competición", "Puntos FINA"], horizontal=True,
+                         key="meet_objective")
+    if objective == "Puntos FINA":
+        st.caption("Se maximiza la suma de puntos FINA de los tiempos inscritos (en la piscina de la competición)")
+    else:
+        places = ", ".join(f"{place}º = {points}" for place, points in enumerate(MEET_POINTS, 1))
+        with st.expander("📋 Tiempos esperados por puesto (editable)"):
+            st.caption(f"Puntos: {places}. Por defecto, cuantiles de los tiempos del club; "
+                       "sustitúyelos por resultados reales de la competición.")
+            default_table = render_cache_get(('tabla_puntos', log.key, pool, category), lambda: default_points_table(best))
+            points_table = st.data_editor(default_table, use_container_width=True, hide_index=True,
+                                          disabled=['Prueba', 'Sexo'], key=f"meet_points_{pool}_{category}")
+
+    fill_entries = st.checkbox("Completar plazas libres aunque no sumen puntos", value=False)
+
+    if st.button("🧮 Calcular inscripciones", type="primary"):
+        start = time.perf_counter()
+        if objective == "Puntos FINA":
+            points = get_meet_fina_points(log, pool, category, best)
+        else:
+            points = expected_points(best, points_table)
+        entries = optimize_meet_entries(best, points, int(max_events), int(max_per_event), fill_entries)
+        st.session_state.meet_entries = (log.key, (pool, category, objective), entries, time.perf_counter() - start)
+
+    result = st.session_state.get('meet_entries')
+    if result is None or result[0] != log.key or result[1] != (pool, category, objective):
+        return
+
+    _, _, entries, elapsed = result
+    if entries.empty:
+        st.warning("Ningún nadador alcanza puntos con la tabla actual")
+        return
+
+    df = log.view()
+    names = pd.Series(df['Nombre'].values, index=df[ID_COL].values)
+    order = {prueba: i for i, prueba in enumerate(PRUEBAS)}
+    points_label = 'Puntos FINA' if objective == "Puntos FINA" else 'Puntos esperados'
+    shown = pd.DataFrame({
+        'Prueba': entries['Prueba'].values,
+        'Sexo': entries['Sexo'].values,
+        'Nadador': entries[ID_COL].map(names).values,
+        f'Tiempo ({pool})': format_centesimas(entries['Centesimas']).values,
+        points_label: entries['Puntos'].values
+    }).sort_values(['Prueba', 'Sexo', f'Tiempo ({pool})'],
+                   key=lambda col: col.map(order) if col.name == 'Prueba' else col)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric(f"🏆 {points_label}", f"{entries['Puntos'].sum():.0f}")
+    with col2:
+        st.metric("📝 Inscripciones", len(entries))
+    with col3:
+        st.metric("🏊 Nadadores", entries[ID_COL].nunique())
+    st.caption(f"Calculado en {elapsed:.2f}s")
+
+    st.dataframe(shown, use_container_width=True, hide_index=True)
+
+    per_swimmer = shown.groupby('Nadador').agg(Pruebas=('Prueba', ', '.join), Puntos=(points_label, 'sum'))
+    with st.expander("👤 Resumen por nadador"):
+        st.dataframe(per_swimmer.sort_values('Puntos', ascending=False), use_container_width=True)
+
+# ============== COMPARAR Y FUSIONAR TEMPORADAS ==============
+
+def identity_hashes(df):
+    """Hash de 64 bits de la clave nombre|año|sexo de cada fila"""
+    return pd.util.hash_pandas_object(swimmer_key(df), index=False).values
+
+def next_season_name(sheet):
+    """Nombre de la temporada siguiente ("2024-2025" → "2025-2026")"""
+    match = re.fullmatch(r'\s*((?:19|20)\d{2})\s*([-/])\s*((?:19|20)?\d{2})\s*', str(sheet))
+    if not match:
+        return f"{sheet} (siguiente)"
+    start, sep, end = int(match.group(1)), match.group(2), match.group(3)
+    return f"{start + 1}{sep}{int(end) + 1:0{len(end)}d}"
+
+def long_course_times(*frames):
+    """Tiempos de cada hoja en centésimas equivalentes de 50m (filas × PRUEBAS, NaN sin tiempo).
+
+    Cada texto de tiempo distinto se interpreta una sola vez para todas las
+    hojas (entre temporadas seguidas se repiten casi todos), y comparar y
+    fusionar reutilizan el resultado en vez de leer cada prueba otra vez.
+    """
+    columns = [[prueba for prueba in PRUEBAS if prueba in df.columns] for df in frames]
+    texts = [df[prueba].to_numpy(dtype=object) for df, present in zip(frames, columns) for prueba in present]
+    codes, uniques = pd.factorize(np.concatenate(texts) if texts else np.array([], dtype=object))
+    parsed = np.append(times_to_centesimas(pd.Series(uniques, dtype=object)).to_numpy(dtype=float), np.nan)
+    values = parsed[codes]   # código -1 (vacío) → NaN del final
+
+    increments = pool_increments()
+    result, offset = [], 0
+    for df, present in zip(frames, columns):
+        times = np.full((len(df), len(PRUEBAS)), np.nan)
+        for prueba in present:
+            centesimas = values[offset:offset + len(df)]
+            offset += len(df)
+            if f"{prueba}Piscina" in df.columns:
+                centesimas = centesimas + increments[prueba] * (df[f"{prueba}Piscina"].to_numpy() == '25m')
+            times[:, PRUEBAS.index(prueba)] = centesimas
+        result.append(times)
+    return result
+
+def compare_seasons(old, new):
+    """Compara dos temporadas uniendo por la clave normalizada del nadador.
+
+    La unión es un hash join: la clave se reduce a un hash de 64 bits y se
+    alinea con un índice hash de pandas (get_indexer). Devuelve las filas
+    nuevas y las bajas (posiciones), las parejas comunes y un registro de
+    celdas cambiadas con una columna 'Mejora' para los tiempos. También
+    devuelve los tiempos de ambas hojas en equivalente de 50m, que reutiliza
+    `merge_seasons`.
+    """
+    old_times, new_times = long_course_times(old, new)
+    old_hash, new_hash = identity_hashes(old), identity_hashes(new)
+    old_first = ~pd.Series(old_hash).duplicated().values
+    new_first = ~pd.Series(new_hash).duplicated().values
+
+    old_index = pd.Index(old_hash[old_first])
+    old_rows = np.flatnonzero(old_first)
+    match = old_index.get_indexer(new_hash)
+    matched = (match >= 0) & new_first
+
+    new_pos = np.flatnonzero(matched)
+    old_pos = old_rows[match[matched]]
+    added = np.flatnonzero((match < 0) & new_first)
+    removed = old_rows[~old_index.isin(new_hash)]
+
+    columns = [col for col in new.columns if col in old.columns and col not in (ID_COL, 'Edad')]
+    names = new['Nombre'].to_numpy()[new_pos]
+
+    # Celdas distintas columna a columna; los tiempos cambiados se comparan en equivalente de 50m
+    fields = {'Nombre': [], 'Antes': [], 'Después': [], 'Mejora': [], 'Fila': []}
+    changed_columns, kinds, counts = [], [], []
+    for col in columns:
+        before = old[col].to_numpy()[old_pos]
+        after = new[col].to_numpy()[new_pos]
+        # Vacíos iguales (NaN != NaN) solo se descartan entre las celdas distintas, que suelen ser pocas
+        rows = np.flatnonzero(before != after)
+        rows = rows[~(pd.isna(before[rows]) & pd.isna(after[rows]))]
+        if not len(rows):
+            continue
+
+        if col in PRUEBAS:
+            kind = 'Tiempo'
+            j = PRUEBAS.index(col)
+            x, y = old_times[old_pos[rows], j], new_times[new_pos[rows], j]
+            # Mejora solo cuando hay tiempo antes y después y el nuevo es más rápido
+            improvement = np.where(np.isnan(x) | np.isnan(y), None, y < x)
+        else:
+            kind = 'Detalle de tiempo' if col.endswith(('Piscina', 'Fecha')) else 'Datos'
+            improvement = np.full(len(rows), None, dtype=object)
+        fields['Nombre'].append(names[rows])
+        fields['Antes'].append(before[rows].astype(object))
+        fields['Después'].append(after[rows].astype(object))
+        fields['Mejora'].append(improvement.astype(object))
+        fields['Fila'].append(new_pos[rows])
+        changed_columns.append(col)
+        kinds.append(kind)
+        counts.append(len(rows))
+
+    changes = pd.DataFrame({name: np.concatenate(values) if values else [] for name, values in fields.items()})
+    changes.insert(1, 'Columna', np.repeat(np.array(changed_columns, dtype=object), counts))
+    changes.insert(4, 'Tipo', np.repeat(np.array(kinds, dtype=object), counts))
+
+    return {
+        'added': added,
+        'removed': removed,
+        'old_pos': old_pos,
+        'new_pos': new_pos,
+        'changes': changes,
+        'old_times': old_times,
+        'new_times': new_times,
+        'duplicates': int((~old_first).sum() + (~new_first).sum()),
+        'only_old_columns': [col for col in old.columns if col not in new.columns],
+        'only_new_columns': [col for col in new.columns if col not in old.columns]
+    }
+
+def merge_seasons(old, new, comparison, include_removed=False):
+    """Temporada fusionada: plantilla de la nueva con la mejor marca de ambas en cada prueba.
+
+    Cada tiempo se elige comparando en equivalente de 50m y arrastra su
+    piscina y su fecha. Con `include_removed` también se copian los
+    nadadores que solo están en la anterior.
+    """
+    merged = new.copy()
+    old_pos, new_pos = comparison['old_pos'], comparison['new_pos']
+
+    for j, prueba in enumerate(PRUEBAS):
+        if prueba not in old.columns:
+            continue
+        detail = [col for col in (f"{prueba}Piscina", f"{prueba}Fecha") if col in old.columns]
+        for col in [prueba] + detail:
+            if col not in merged.columns:
+                merged[col] = None
+
+        before, after = comparison['old_times'][old_pos, j], comparison['new_times'][new_pos, j]
+        take_old = ~np.isnan(before) & (np.isnan(after) | (before < after))
+        if not take_old.any():
+            continue
+        target = new_pos[take_old]
+        for col in [prueba] + detail:
+            if merged[col].dtype != object:
+                merged[col] = merged[col].astype(object)
+            merged.iloc[target, merged.columns.get_loc(col)] = old[col].iloc[old_pos[take_old]].values
+
+    if include_removed and len(comparison['removed']):
+        carried = old.iloc[comparison['removed']].drop(columns=[col for col in old.columns if col not in merged.columns])
+        merged = pd.concat([merged, carried], ignore_index=True)
+
+    return assign_swimmer_ids(merged)
+
+def get_season_comparison(log, old_sheet, new_sheet):
+    """Comparación entre dos hojas, cacheada por versión de los datos"""
+    key = ('comparar', log.id, old_sheet, new_sheet)
+    if st.session_state.get('current_sheet') in (old_sheet, new_sheet):
+        key += (log.key,)
+    return render_cache_get(key, lambda: compare_seasons(get_season_frame(log, old_sheet),
+                                                         get_season_frame(log, new_sheet)))
+
+def show_season_compare(log):
+    """Comparar dos temporadas y generar la siguiente a partir de ellas"""
+    st.header("🔀 Comparar y Fusionar Temporadas")
+
+    source = st.session_state.get('season_source')
+    if source is None or len(source.sheet_names) < 2:
+        st.info("Carga un archivo con al menos dos temporadas (hojas) para compararlas")
+        return
+
+    sheets = season_order(list(source.sheet_names))
+    col_old, col_new = st.columns(2)
+    with col_old:
+        old_sheet = st.selectbox("📅 Temporada anterior", sheets, index=len(sheets) - 2, key="compare_old")
+    with col_new:
+        new_sheet = st.selectbox("📅 Temporada nueva", sheets, index=len(sheets) - 1, key="compare_new")
+
+    if old_sheet == new_sheet:
+        st.warning("Elige dos temporadas distintas")
+        return
+
+    start = time.perf_counter()
+    comparison = get_season_comparison(log, old_sheet, new_sheet)
+    elapsed = time.perf_counter() - start
+    old, new = get_season_frame(log, old_sheet), get_season_frame(log, new_sheet)
+    changes = comparison['changes']
+    time_changes = changes[changes['Tipo'] == 'Tiempo']
+
+    col1, col2, col3, col4, col5 = st.columns(5)
+    with col1:
+        st.metric("🆕 Nuevos", len(comparison['added']))
+    with col2:
+        st.metric("👋 Bajas", len(comparison['removed']))
+    with col3:
+        st.metric("✏️ Con cambios", changes['Fila'].nunique())
+    with col4:
+        st.metric("⏱️ Tiempos cambiados", len(time_changes))
+    with col5:
+        st.metric("📈 Mejoras", int((time_changes['Mejora'] == True).sum()))
+    st.caption(f"Comparación en {elapsed:.2f}s (unión por nombre, año de nacimiento y sexo)")
+
+    if comparison['duplicates']:
+        st.warning(f"⚠️ {comparison['duplicates']} filas con nadador repetido se han ignorado (ver Calidad de Datos)")
+    if comparison['only_old_columns'] or comparison['only_new_columns']:
+        st.caption(f"Columnas solo en la anterior: {comparison['only_old_columns'] or '—'} · "
+                   f"solo en la nueva: {comparison['only_new_columns'] or '—'}")
+
+    list_columns = [col for col in ['Nombre', 'Sexo', 'AñoNacimiento'] if col in new.columns]
+    with st.expander(f"🆕 Nuevos ({len(comparison['added'])})"):
+        st.dataframe(new[list_columns].iloc[comparison['added']], use_container_width=True, hide_index=True)
+    with st.expander(f"👋 Bajas ({len(comparison['removed'])})"):
+        st.dataframe(old[list_columns].iloc[comparison['removed']], use_container_width=True, hide_index=True)
+    with st.expander(f"✏️ Cambios ({len(changes)})"):
+        shown = changes.drop(columns='Fila').astype(str).replace({'nan': '', 'None': ''})
+        st.dataframe(shown.head(1000), use_container_width=True, hide_index=True)
+        if len(shown) > 1000:
+            st.info(f"... mostrando 1000 de {len(shown)} cambios")
+
+    if not has_permission('edit'):
+        return
+
+    st.subheader("🧬 Generar temporada fusionada")
+    st.caption(f"Plantilla de '{new_sheet}' con la mejor marca de cada prueba entre ambas temporadas")
+    col_name, col_removed = st.columns(2)
+    with col_name:
+        merged_name = st.text_input("Nombre de la nueva temporada", value=next_season_name(new_sheet))
+    with col_removed:
+        include_removed = st.checkbox(f"Incluir bajas de '{old_sheet}'", value=False)
+
+    if st.button("🧬 Generar temporada", type="primary"):
+        merged = merge_seasons(old, new, comparison, include_removed)
+        st.session_state.merged_season = (merged_name, merged)
+
+    result = st.session_state.get('merged_season')
+    if result is None:
+        return
+
+    merged_name, merged = result
+    st.success(f"✅ '{merged_name}': {len(merged)} nadadores")
+    col_download, col_load = st.columns(2)
+    with col_download:
+        if has_permission('download'):
+            data = render_cache_get(('fusion', id(merged)), lambda: excel_bytes(merged, merged_name[:31]))
+            st.download_button(f"📥 Descargar {merged_name}", data=data,
+                               file_name=f"nadadores_{merged_name}.xlsx",
+                               mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    with col_load:
+        if st.button("📂 Usar como temporada activa"):
+            # La fusión es una temporada nueva: se comparte solo con quien genere la misma
+            shared = attach_shared_season(('fusion', old_sheet, new_sheet, merged_name), merged)
+            season_log = SeasonEditLog(shared.base)
+            start_shared_session(shared)
+            pull_shared_changes(season_log)
+            stop_sync_worker()
+            st.session_state.season_log = season_log
+            st.session_state.current_sheet = merged_name
+            st.session_state.sync_conflicts = []
+            st.session_state.pop('season_sheets_url', None)
+            st.session_state.pop('sync_baseline', None)
+            st.session_state.pop('merged_season', None)
+            st.rerun()
+
+# ============== INFORMES ==============
+
+# Plantillas (string.Template) de fichas y resúmenes. Se pueden sustituir con
+# archivos <nombre>.html en NADADORES_TEMPLATES_DIR.
+TEMPLATES_DIR = os.environ.get("NADADORES_TEMPLATES_DIR", "")
+REPORT_TEMPLATES = {
+    'pagina': """<!DOCTYPE html>
+<html lang="es"><head><meta charset="utf-8"><title>$titulo</title>
+<style>
+body { font-family: Helvetica, Arial, sans-serif; font-size: 11pt; color: #1f2933; }
+h1 { font-size: 18pt; margin-bottom: 2pt; }
+h2 { font-size: 13pt; margin-top: 14pt; }
+.meta { color: #52606d; margin-bottom: 10pt; }
+table { border-collapse: collapse; width: 100%; }
+th, td { border: 1px solid #cbd2d9; padding: 3pt 5pt; text-align: left; }
+th { background: #e4e7eb; }
+</style></head>
+<body>
+$contenido
+<p class="meta">Club Natación Las Palmas · $temporada · generado el $fecha</p>
+</body></html>
+""",
+    'ficha': """<h1>$nombre</h1>
+<div class="meta">Sexo: $sexo · Año de nacimiento: $nacimiento · Edad: $edad · Categoría: $categoria · $disponible</div>
+<h2>Mejores marcas</h2>
+<table><tr><th>Prueba</th><th>Tiempo</th><th>Piscina</th><th>Fecha</th><th>Equiv. 25m</th><th>Equiv. 50m</th></tr>
+$filas
+</table>
+""",
+    'fila_ficha': "<tr><td>$prueba</td><td>$tiempo</td><td>$piscina</td><td>$fecha</td><td>$t25</td><td>$t50</td></tr>",
+    'categoria': """<h1>$categoria</h1>
+<div class="meta">$nadadores nadadores · $disponibles disponibles</div>
+<h2>Mejores marcas (equivalentes en 50m)</h2>
+<table><tr><th>Sexo</th><th>Prueba</th><th>Nadador</th><th>Tiempo</th></tr>
+$mejores
+</table>
+<h2>Nadadores</h2>
+<table><tr><th>Nombre</th><th>Sexo</th><th>Edad</th><th>Disponible</th><th>Tiempos</th></tr>
+$lista
+</table>
+""",
+    'fila_mejor': "<tr><td>$sexo</td><td>$prueba</td><td>$nadador</td><td>$tiempo</td></tr>",
+    'fila_lista': "<tr><td>$nombre</td><td>$sexo</td><td>$edad</td><td>$disponible</td><td>$tiempos</td></tr>",
+}
+
+@st.cache_resource
+def load_report_templates(templates_dir):
+    """Plantillas compiladas una sola vez por proceso (las del directorio sustituyen a las de serie)"""
+    templates = {}
+    for name, text in REPORT_TEMPLATES.items():
+        path = os.path.join(templates_dir, f"{name}.html") if templates_dir else ""
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        templates[name] = Template(text)
+    return templates
+
+def pdf_backend():
+    """Biblioteca local disponible para generar PDF (None si no hay ninguna)"""
+    for module in ('weasyprint', 'xhtml2pdf'):
+        if find_spec(module) is not None:
+            return module
+    return None
+
+def html_to_pdf(html, backend):
+    """Convierte una página HTML a PDF con la biblioteca `backend` (importada solo al usarla)"""
+    if backend == 'weasyprint':
+        from weasyprint import HTML
+        return HTML(string=html).write_pdf()
+
+    from xhtml2pdf import pisa
+    buffer = io.BytesIO()
+    status = pisa.CreatePDF(html, dest=buffer, encoding='utf-8')
+    if status.err:
+        raise RuntimeError("No se pudo generar el PDF")
+    return buffer.getvalue()
+
+def build_card_data(df):
+    """Datos de todas las fichas en una pasada: mejor marca por prueba y equivalencias 25m/50m"""
+    long = season_times_long(df)
+    if long.empty:
+        return {}
+
+    pools = arrow_to_series(arrow_text(long['Piscina'].fillna('')), long.index)
+    centesimas = times_to_centesimas(long['Tiempo'])
+    long['Piscina'] = pools
+    long['C50'] = to_pool(centesimas, long['Prueba'], pools, '50m')
+    long['C25'] = to_pool(centesimas, long['Prueba'], pools, '25m')
+    long = long.dropna(subset=['C50'])
+
+    best = long.sort_values('C50', kind='mergesort').drop_duplicates([ID_COL, 'Prueba'])
+    order = {prueba: i for i, prueba in enumerate(PRUEBAS)}
+    best = best.assign(Orden=best['Prueba'].map(order)).sort_values([ID_COL, 'Orden'])
+    fecha = pd.to_datetime(best['Fecha'], errors='coerce', dayfirst=True, format='mixed')
+    rows = pd.DataFrame({
+        'prueba': best['Prueba'].values,
+        'tiempo': best['Tiempo'].astype(str).str.strip().values,
+        'piscina': best['Piscina'].values,
+        'fecha': fecha.dt.strftime('%d/%m/%Y').fillna('').values,
+        't25': format_centesimas(best['C25']).values,
+        't50': format_centesimas(best['C50']).values
+    })
+    # Filas ya ordenadas por nadador: cada ficha es un tramo contiguo
+    records = rows.to_dict('records')
+    ids, starts = np.unique(best[ID_COL].values, return_index=True)
+    ends = list(starts[1:]) + [len(records)]
+    return {swimmer_id: records[start:end] for swimmer_id, start, end in zip(ids, starts, ends)}
+
+def get_card_data(log):
+    """Mejores marcas de cada nadador para las fichas, cacheadas por versión"""
+    return render_cache_get(('fichas', log.key), lambda: build_card_data(log.view()))
+
+def escape_html(value):
+    return html.escape("" if value is None or pd.isna(value) else str(value))
+
+def fill_rows(template, rows):
+    """Filas de tabla HTML a partir de una lista de diccionarios"""
+    return "\n".join(template.safe_substitute({key: escape_html(value) for key, value in row.items()}) for row in rows)
+
+def render_swimmer_card(templates, swimmer, rows):
+    """Ficha HTML de un nadador"""
+    return templates['ficha'].safe_substitute(
+        {key: escape_html(value) for key, value in swimmer.items()},
+        filas=fill_rows(templates['fila_ficha'], rows) or '<tr><td colspan="6">Sin tiempos registrados</td></tr>')
+
+def render_category_sheet(templates, category, counts, best_rows, roster_rows):
+    """Resumen HTML de una categoría"""
+    return templates['categoria'].safe_substitute(
+        categoria=escape_html(category), nadadores=counts['Nadadores'], disponibles=counts['Disponibles'],
+        mejores=fill_rows(templates['fila_mejor'], best_rows) or '<tr><td colspan="4">Sin tiempos registrados</td></tr>',
+        lista=fill_rows(templates['fila_lista'], roster_rows))
+
+def render_report(templates, job, page, fmt, backend):
+    """Un informe completo: (nombre de archivo, bytes)"""
+    kind, filename, title, args = job
+    content = render_swimmer_card(templates, *args) if kind == 'ficha' else render_category_sheet(templates, *args)
+    html = templates['pagina'].safe_substitute(page, titulo=escape_html(title), contenido=content)
+    if fmt == 'PDF':
+        return f"{filename}.pdf", html_to_pdf(html, backend)
+    return f"{filename}.html", html.encode('utf-8')
+
+def report_filenames(names):
+    """Nombres de archivo seguros (sin acentos ni símbolos), vectorizado"""
+    safe = normalize_text(names.astype(str)).str.replace(r'[^a-z0-9]+', '_', regex=True).str.strip('_')
+    return safe.where(safe != '', 'informe')
+
+def swimmer_card_jobs(log, swimmer_ids):
+    """Trabajos de fichas: datos de los nadadores y sus filas, preparados en bloque en el hilo principal"""
+    labels = [log.index[swimmer_id] for swimmer_id in swimmer_ids]
+    df = log.view().loc[labels]
+    categories = get_season_categories(log).loc[labels]
+    available = get_roster_render(log)['available'].loc[labels]
+    cards = get_card_data(log)
+
+    swimmers = pd.DataFrame({
+        'nombre': df['Nombre'].values,
+        'sexo': df['Sexo'].values if 'Sexo' in df.columns else '',
+        'nacimiento': df['AñoNacimiento'].values if 'AñoNacimiento' in df.columns else '',
+        'edad': categories['Edad'].values,
+        'categoria': categories['Categoría'].astype(str).values,
+        'disponible': np.where(available.values, 'Disponible', 'No disponible')
+    }).to_dict('records')
+    filenames = report_filenames(df['Nombre'])
+    return [('ficha', f"ficha_{filename}_{swimmer_id}", f"Ficha de {swimmer['nombre']}",
+             (swimmer, cards.get(swimmer_id, [])))
+            for swimmer_id, filename, swimmer in zip(df[ID_COL], filenames, swimmers)]
+
+def category_sheet_jobs(log, category_list):
+    """Trabajos de resúmenes por categoría"""
+    summary = get_category_summary(log)
+    roster = get_roster_render(log)
+    display_df = roster['display']
+    best = summary['best']
+    filenames = report_filenames(pd.Series(category_list, dtype=object))
+    jobs = []
+    for category, filename in zip(category_list, filenames):
+        counts = summary['summary'][summary['summary']['Categoría'] == category][['Nadadores', 'Disponibles']].sum()
+        members = display_df[display_df['Categoría'] == category].sort_values('Nombre')
+        best_rows = [{'sexo': r['Sexo'], 'prueba': r['Prueba'], 'nadador': r['Nadador'], 'tiempo': r['Tiempo (50m)']}
+                     for r in best[best['Categoría'] == category].to_dict('records')]
+        roster_rows = [{'nombre': r['Nombre'], 'sexo': r['Sexo'], 'edad': r['Edad'],
+                        'disponible': 'Sí' if roster['available'].loc[label] else 'No',
+                        'tiempos': roster['times_count'].loc[label]}
+                       for label, r in zip(members.index, members.to_dict('records'))]
+        jobs.append(('categoria', f"categoria_{filename}", f"Resumen {category}",
+                     (category, counts, best_rows, roster_rows)))
+    return jobs
+
+def generate_reports(templates, jobs, page, fmt, backend=None):
+    """Renderiza los informes y los devuelve empaquetados en un ZIP"""
+    # En serie: plantillas y maquetación PDF son Python puro (el GIL impide
+    # paralelizarlas con hilos) y weasyprint no garantiza ser seguro entre hilos
+    files = [render_report(templates, job, page, fmt, backend) for job in jobs]
+
+    buffer = io.BytesIO()
+    # Los PDF ya van comprimidos
+    compression = zipfile.ZIP_STORED if fmt == 'PDF' else zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(buffer, 'w', compression) as archive:
+        for filename, data in files:
+            archive.writestr(filename, data)
+    return buffer.getvalue(), len(files)
+
+def show_reports(log):
+    """Generación de fichas de nadadores y resúmenes por categoría"""
+    st.header("🖨️ Informes")
+    st.caption("Fichas de nadadores y resúmenes por categoría listos para imprimir o enviar")
+
+    if not has_permission('download'):
+        st.warning("🔒 No tienes permisos para generar informes")
+        return
+
+    backend = pdf_backend()
+    col_kind, col_category, col_format = st.columns(3)
+    with col_kind:
+        kind = st.selectbox("📄 Tipo de informe", ["Fichas de nadadores", "Resúmenes por categoría"])
+    with col_category:
+        category = st.selectbox("🏷️ Categoría", ["Todas"] + category_names(get_category_rules()), key="report_category")
+    with col_format:
+        fmt = st.selectbox("💾 Formato", ["HTML", "PDF"] if backend else ["HTML"])
+    if backend is None:
+        st.caption("Para PDF instala `weasyprint` o `xhtml2pdf`")
+
+    only_available = False
+    if kind == "Fichas de nadadores":
+        only_available = st.checkbox("Solo nadadores disponibles", value=False)
+
+    options = (log.key, st.session_state.get('current_sheet'), kind, category, fmt, only_available)
+    if st.button("🖨️ Generar informes", type="primary"):
+        start = time.perf_counter()
+        if kind == "Fichas de nadadores":
+            display_df = get_roster_render(log)['display']
+            mask = pd.Series(True, index=display_df.index)
+            if category != "Todas":
+                mask &= display_df['Categoría'] == category
+            if only_available:
+                mask &= get_roster_render(log)['available']
+            jobs = swimmer_card_jobs(log, display_df.loc[mask, ID_COL])
+        else:
+            present = get_category_summary(log)['summary']['Categoría']
+            names = [c for c in category_names(get_category_rules()) if c in set(present)]
+            jobs = category_sheet_jobs(log, names if category == "Todas" else [c for c in names if c == category])
+
+        if not jobs:
+            st.warning("No hay nadadores que coincidan con la selección")
+        else:
+            page = {'temporada': escape_html(st.session_state.get('current_sheet', '')),
+                    'fecha': datetime.now().strftime('%d/%m/%Y %H:%M')}
+            try:
+                data, count = generate_reports(load_report_templates(TEMPLATES_DIR), jobs, page, fmt, backend)
+                st.session_state.report_zip = (options, data, count, time.perf_counter() - start)
+            except Exception as e:
+                st.error(f"❌ Error generando informes: {e}")
+
+    result = st.session_state.get('report_zip')
+    if result is None or result[0] != options:
+        return
+
+    _, data, count, elapsed = result
+    st.success(f"✅ {count} informes generados en {elapsed:.2f}s")
+    st.download_button(
+        label=f"📥 Descargar informes ({len(data) / 1024:.0f} KB)",
+        data=data,
+        file_name=f"informes_{report_filenames(pd.Series([st.session_state.get('current_sheet', 'temporada')])).iloc[0]}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+        mime="application/zip"
+    )
+
+# ============== PERFILADO ==============
+
+# NADADORES_PROFILE=1 muestra en la barra lateral el tiempo de cada fase del rerun
+PROFILE_ENABLED = os.environ.get("NADADORES_PROFILE") == "1"
+PROFILE_HISTORY = 50
+BENCHMARK_RUNS = 5
+
+# Marcas del rerun en curso: el script se ejecuta entero en cada rerun, así que se reinician solas
+PROFILE_MARKS = [("importaciones", IMPORTS_DONE)]
+
+def profile_mark(phase):
+    """Cierra la fase `phase` del rerun actual"""
+    PROFILE_MARKS.append((phase, time.perf_counter()))
+
+def profile_phases():
+    """Duración en ms de cada fase del rerun actual"""
+    phases = {}
+    previous = SCRIPT_START
+    for phase, mark in PROFILE_MARKS:
+        phases[phase] = (mark - previous) * 1000
+        previous = mark
+    phases['total'] = (previous - SCRIPT_START) * 1000
+    return phases
+
+def show_profile():
+    """Tiempos del rerun actual y de los anteriores de la sesión"""
+    history = st.session_state.setdefault('profile_history', [])
+    history.append(profile_phases())
+    del history[:-PROFILE_HISTORY]
+
+    with st.sidebar.expander("⏱️ Perfil del rerun"):
+        last = history[-1]
+        totals = pd.Series([run['total'] for run in history])
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Este rerun", f"{last['total']:.0f} ms")
+        with col2:
+            st.metric(f"Mediana ({len(history)})", f"{totals.median():.0f} ms")
+        st.dataframe(pd.Series(last, name="ms").round(1), use_container_width=True)
+
+# Estado de sesión que se conserva entre reruns del benchmark (datos y cachés, no widgets)
+BENCHMARK_STATE_KEYS = SESSION_KEYS + ['season_log', 'current_sheet', 'render_cache', 'export_cache']
+
+def benchmark_run(script, data_file=None, state=None):
+    """Una ejecución de la app con AppTest.
+
+    Devuelve (ms totales, ms del script según el perfil, estado de sesión).
+    Cada rerun usa un AppTest nuevo con el estado anterior: el AppTest de
+    Streamlit 1.29 no puede repetir runs con selectores con format_func.
+    """
+    from streamlit.testing.v1 import AppTest
+
+    os.environ["NADADORES_PROFILE"] = "1"
+    app = AppTest.from_file(script, default_timeout=120)
+    if state is not None:
+        for key, value in state.items():
+            app.session_state[key] = value
+    elif data_file:
+        store = get_user_store()
+        admin = next(name for name, user in store.users.items()
+                     if user.get('role') == 'admin' and user.get('active', True))
+        app.session_state['auth_token'] = sign_session(store, admin)
+        app.session_state['username'] = admin
+        sheet = pd.ExcelFile(data_file).sheet_names[0]
+        app.session_state['season_log'] = SeasonEditLog(pd.read_excel(data_file, sheet_name=sheet))
+        app.session_state['current_sheet'] = sheet
+
+    start = time.perf_counter()
+    app.run()
+    elapsed = (time.perf_counter() - start) * 1000
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+
+    session = app.session_state.filtered_state
+    script_ms = session['profile_history'][-1]['total']
+    return elapsed, script_ms, {key: session[key] for key in BENCHMARK_STATE_KEYS if key in session}
+
+def run_benchmark(args):
+    """Arranque en frío y reruns en caliente.
+
+    Uso: python nadadores_completo1.py --benchmark [temporada.xlsx]
+    Sin archivo mide la pantalla de login; con archivo, la app con sesión de
+    administrador y la primera hoja cargada. Cada arranque en frío es un
+    proceso nuevo (importaciones + primer render). "Script" es el tiempo
+    del propio script según el perfilado; el resto es sobrecarga de AppTest.
+    """
+    script = os.path.abspath(__file__)
+    data_file = next((arg for arg in args if arg.endswith(('.xlsx', '.xls'))), None)
+
+    if '--cold' in args:
+        elapsed, script_ms, _ = benchmark_run(script, data_file)
+        print(f"{(IMPORTS_DONE - SCRIPT_START) * 1000:.1f} {elapsed:.1f} {script_ms:.1f}")
+        return
+
+    cold = []
+    for _ in range(BENCHMARK_RUNS):
+        child = subprocess.run([sys.executable, script, '--benchmark', '--cold'] + ([data_file] if data_file else []),
+                               capture_output=True, text=True, check=True)
+        cold.append([float(value) for value in child.stdout.split()[-3:]])
+
+    _, _, state = benchmark_run(script, data_file)
+    warm = []
+    for _ in range(BENCHMARK_RUNS):
+        elapsed, script_ms, state = benchmark_run(script, data_file, state)
+        warm.append((elapsed, script_ms))
+
+    def median(values):
+        return statistics.median(values)
+
+    scenario = f"app con '{data_file}'" if data_file else "pantalla de login"
+    print(f"Benchmark ({scenario}, {BENCHMARK_RUNS} ejecuciones, mediana)")
+    print(f"  Importaciones en frío: {median(c[0] for c in cold):8.1f} ms")
+    print(f"  Primer render en frío: {median(c[1] for c in cold):8.1f} ms (script {median(c[2] for c in cold):.1f} ms)")
+    print(f"  Arranque en frío:      {median(c[0] + c[1] for c in cold):8.1f} ms")
+    print(f"  Rerun en caliente:     {median(w[0] for w in warm):8.1f} ms (script {median(w[1] for w in warm):.1f} ms)")
+
+# ============== APLICACIÓN PRINCIPAL ==============
+
+def main():
+    # Verificar autenticación
+    if not check_authentication():
+        profile_mark("login")
+        return
+    profile_mark("autenticación")
+    
+    # Cambios llegados de Google Sheets desde el último rerun
+    if get_season_log() is not None:
+        process_sync_updates(get_season_log())
+        if pull_shared_changes(get_season_log()):
+            st.toast("🤝 Cambios de otros usuarios aplicados")
+    
+    # Título
+    st.title("🏊‍♂️ Club Natación Las Palmas")
+    st.markdown("### 🏆 Sistema Integral de Gestión de Temporadas")
+    
+    # Navegación principal por pestañas
+    if has_permission('user_management'):
+        tabs = st.tabs(["🏊‍♂️ Gestión Nadadores", "🔄 Conversión Masiva", "📈 Progresión", "🏅 Inscripciones",
+                        "🔀 Temporadas", "🖨️ Informes", "👥 Gestión Usuarios"])
+    else:
+        tabs = st.tabs(["🏊‍♂️ Gestión Nadadores", "🔄 Conversión Masiva", "📈 Progresión", "🏅 Inscripciones",
+                        "🔀 Temporadas", "🖨️ Informes"])
     
     # Pestaña 1: Gestión de Nadadores
     with tabs[0]:
@@ -738,18 +3553,58 @@ def main():
                     help="Cada hoja representa una temporada diferente"
                 )
                 
+                # Con Parquet, resumen leyendo solo las columnas de la lista
+                if getattr(excel_file, 'is_parquet', False):
+                    preview = read_season(excel_file, selected_sheet, LIST_COLUMNS)
+                    available = int(preview['Disponible'].fillna(False).astype(bool).sum()) if 'Disponible' in preview else 0
+                    st.caption(f"🗂️ {len(preview)} nadadores · {available} disponibles")
+                
                 if st.button("📂 Cargar Temporada", type="primary"):
                     try:
-                        df = pd.read_excel(excel_file, sheet_name=selected_sheet)
-                        st.session_state.df = df
+                        df = read_season(excel_file, selected_sheet)
+                        # Sesiones con la misma temporada comparten base y cambios confirmados
+                        shared = attach_shared_season(season_source_key(excel_file, selected_sheet), df)
+                        season_log = SeasonEditLog(shared.base)
+                        start_shared_session(shared)
+                        pull_shared_changes(season_log)
+                        st.session_state.season_log = season_log
                         st.session_state.current_sheet = selected_sheet
+                        st.session_state.season_source = excel_file
+                        
+                        # Base para sincronizar si la temporada viene de Google Sheets
+                        stop_sync_worker()
+                        st.session_state.sync_conflicts = []
+                        if excel_file is st.session_state.get('sheets_excel'):
+                            st.session_state.season_sheets_url = st.session_state.sheets_url
+                            st.session_state.sync_baseline = season_log.base
+                        else:
+                            st.session_state.pop('season_sheets_url', None)
+                            st.session_state.pop('sync_baseline', None)
+                        # La temporada compartida pudo crearse con una versión anterior de la fuente
+                        remote = align_remote(season_log.base, df)
+                        diff = diff_season(season_log.base, remote)
+                        if diff_has_changes(diff):
+                            if 'sync_baseline' in st.session_state:
+                                apply_sync_result(season_log, remote, diff)
+                            else:
+                                apply_remote_diff(season_log, diff)
                         st.success(f"✅ Temporada '{selected_sheet}' cargada")
                         st.success(f"📊 {len(df)} nadadores encontrados")
+                        
+                        # Revisión de calidad de toda la hoja al cargar
+                        report = get_quality_report(season_log)
+                        if not report.empty:
+                            st.warning(f"🩺 {len(report)} incidencias de calidad detectadas")
                     except Exception as e:
                         st.error(f"❌ Error: {str(e)}")
+            
+            show_edit_history()
+            if get_season_log() is not None:
+                show_sync_panel(get_season_log())
+        profile_mark("barra lateral")
         
         # Verificar datos cargados
-        if 'df' not in st.session_state:
+        if get_season_log() is None:
             st.info("👈 **Conecta tu fuente de datos y selecciona una temporada**")
             
             # Mostrar permisos del usuario
@@ -777,17 +3632,21 @@ def main():
             
             return
         
-        df = st.session_state.df
+        season_log = get_season_log()
+        df = season_log.view()
         current_sheet = st.session_state.get('current_sheet', 'Temporada')
         
         # Mostrar temporada actual
         st.info(f"📅 **Temporada Activa:** {current_sheet}")
+        show_sync_conflicts(season_log)
+        show_edit_conflicts(season_log)
+        show_quality_report(season_log)
         
         # ===== TABLA PRINCIPAL DE NADADORES (MÁS VISIBLE) =====
         st.header("📋 Lista Completa de Nadadores")
         
         # Filtros en una fila
-        col_search, col_sex, col_available = st.columns([2, 1, 1])
+        col_search, col_sex, col_available, col_category = st.columns([2, 1, 1, 1])
         
         with col_search:
             search = st.text_input("🔍 Buscar nadador", placeholder="Nombre...")
@@ -798,48 +3657,42 @@ def main():
         with col_available:
             filter_available = st.selectbox("Disponibilidad", ["Todos", "Disponibles", "No disponibles"])
         
-        # Aplicar filtros
-        df_filtered = df.copy()
-        
-        if search:
-            df_filtered = df_filtered[df_filtered['Nombre'].str.contains(search, case=False, na=False)]
-        
-        if filter_sex != "Todos":
-            df_filtered = df_filtered[df_filtered['Sexo'] == filter_sex]
+        with col_category:
+            filter_category = st.selectbox("Categoría", ["Todas"] + category_names(get_category_rules()))
         
-        if filter_available == "Disponibles":
-            df_filtered = df_filtered[df_filtered['Disponible'] == True]
-        elif filter_available == "No disponibles":
-            df_filtered = df_filtered[df_filtered['Disponible'] == False]
+        # Tabla filtrada desde la caché (solo se recalcula si cambian datos o filtros)
+        filtered = get_filtered_render(season_log, search, filter_sex, filter_available, filter_category)
+        display_df = filtered['display']
         
         # Preparar datos para mostrar con información más visible
-        if len(df_filtered) > 0:
-            # Crear DataFrame para mostrar con columnas más informativas
-            display_df = df_filtered.copy()
+        if len(display_df) > 0:
+            # Seleccionar columnas principales para mostrar
+            columns_to_show = ['Nombre', 'Sexo', 'AñoNacimiento', 'Edad', 'Categoría', 'Disponible', 'Tiempos Registrados',
+                               'Puntos FINA', 'Percentil']
             
-            # Formatear columnas para mejor visualización
-            display_df['Disponible'] = display_df['Disponible'].apply(lambda x: '✅ Sí' if x else '❌ No')
-            display_df['Edad'] = display_df.apply(lambda row: datetime.now().year - row.get('AñoNacimiento', 2000), axis=1)
+            # Paginación: solo la página visible se envía al navegador
+            col_sort, col_order, col_size, col_page = st.columns([2, 1, 1, 1])
             
-            # Contar tiempos por nadador
-            tiempos_count = []
-            for idx, row in display_df.iterrows():
-                count = 0
-                for prueba in PRUEBAS:
-                    if prueba in df.columns:
-                        tiempo = row.get(prueba, '')
-                        if pd.notna(tiempo) and str(tiempo).strip():
-                            count += 1
-                tiempos_count.append(f"{count} tiempos")
+            with col_sort:
+                sort_col = st.selectbox("↕️ Ordenar por", columns_to_show)
             
-            display_df['Tiempos Registrados'] = tiempos_count
+            with col_order:
+                sort_dir = st.selectbox("Orden", ["Ascendente", "Descendente"])
             
-            # Seleccionar columnas principales para mostrar
-            columns_to_show = ['Nombre', 'Sexo', 'AñoNacimiento', 'Edad', 'Disponible', 'Tiempos Registrados']
+            with col_size:
+                page_size = st.selectbox("Filas por página", PAGE_SIZE_OPTIONS,
+                                         index=PAGE_SIZE_OPTIONS.index(DEFAULT_PAGE_SIZE))
+            
+            total_pages = max(1, -(-len(display_df) // page_size))
+            with col_page:
+                page = st.number_input("Página", min_value=1, max_value=total_pages, value=1, step=1)
+            
+            page_df = get_page(season_log, filtered, sort_col, sort_dir == "Ascendente", int(page), page_size)
+            st.caption(f"Mostrando {len(page_df)} de {len(display_df)} nadadores · página {int(page)}/{total_pages}")
             
             # Mostrar tabla principal más grande y clara
             st.dataframe(
-                display_df[columns_to_show], 
+                page_df[columns_to_show], 
                 use_container_width=True,
                 height=400,  # Altura fija para mejor visualización
                 column_config={
@@ -847,8 +3700,13 @@ def main():
                     "Sexo": st.column_config.TextColumn("⚥ Sexo", width="small"),
                     "AñoNacimiento": st.column_config.NumberColumn("📅 Año Nac.", width="medium"),
                     "Edad": st.column_config.NumberColumn("🎂 Edad", width="small"),
+                    "Categoría": st.column_config.TextColumn("🏷️ Categoría", width="small"),
                     "Disponible": st.column_config.TextColumn("✅ Disponible", width="medium"),
-                    "Tiempos Registrados": st.column_config.TextColumn("⏱️ Tiempos", width="medium")
+                    "Tiempos Registrados": st.column_config.TextColumn("⏱️ Tiempos", width="medium"),
+                    "Puntos FINA": st.column_config.NumberColumn("🏆 Puntos FINA", width="small",
+                                                                 help="Mejor puntuación FINA de la temporada"),
+                    "Percentil": st.column_config.NumberColumn("📊 Percentil", width="small",
+                                                               help="Mejor percentil en el club (100 = el más rápido)")
                 }
             )
             
@@ -857,20 +3715,35 @@ def main():
                 st.markdown("---")
                 st.subheader("✏️ Editar Nadador Específico")
                 
-                # Selector más visible
-                nadador_names = [f"{row['Nombre']} ({row['Sexo']}, {row['AñoNacimiento']})" 
-                               for idx, row in df_filtered.iterrows()]
+                # Sin búsqueda se ofrecen los nadadores de la página visible
+                picker_query = st.text_input("🔎 Buscar nadador a editar", placeholder="Nombre...",
+                                             help=f"Se muestran hasta {PICKER_LIMIT} coincidencias")
+                if picker_query:
+                    options = search_swimmers(season_log, filtered, picker_query)
+                else:
+                    options = list(page_df[ID_COL])
+                
+                # Mantener la selección aunque cambie el nombre, de página o se elimine otro nadador
+                previous_id = st.session_state.get('selected_swimmer_id')
+                if (previous_id not in options and previous_id in season_log.index
+                        and season_log.index[previous_id] in display_df.index):
+                    options = [previous_id] + options
+                
+                labels = get_roster_render(season_log)['labels']
+                nadador_names = {sid: labels.loc[season_log.index[sid]] for sid in options}
                 
-                if nadador_names:
-                    selected_idx = st.selectbox(
+                if not nadador_names:
+                    st.info("No hay nadadores que coincidan con la búsqueda")
+                else:
+                    swimmer_id = st.selectbox(
                         "Selecciona nadador para editar:",
-                        range(len(nadador_names)),
+                        options,
+                        index=options.index(previous_id) if previous_id in nadador_names else 0,
                         format_func=lambda x: nadador_names[x]
                     )
-                    
-                    # Obtener índice real
-                    real_idx = df_filtered.iloc[selected_idx].name
-                    swimmer = df.loc[real_idx]
+                    st.session_state.selected_swimmer_id = swimmer_id
+
+                    swimmer = shown_row(season_log, swimmer_id)
                     
                     # Formulario de edición expandido
                     with st.expander(f"✏️ Editando: {swimmer.get('Nombre', 'Sin nombre')}", expanded=True):
@@ -879,7 +3752,7 @@ def main():
                         with col1:
                             st.markdown("**📝 Información Personal:**")
                             
-                            with st.form(f"edit_swimmer_{real_idx}"):
+                            with st.form(f"edit_swimmer_{swimmer_id}"):
                                 new_name = st.text_input("Nombre", value=str(swimmer.get('Nombre', '')))
                                 new_available = st.checkbox("Disponible", value=bool(swimmer.get('Disponible', False)))
                                 new_sex = st.selectbox("Sexo", ['M', 'F'], 
@@ -892,52 +3765,41 @@ def main():
                                 
                                 with col_save:
                                     if st.form_submit_button("💾 Guardar Cambios", type="primary"):
-                                        df.loc[real_idx, 'Nombre'] = new_name
-                                        df.loc[real_idx, 'Disponible'] = new_available
-                                        df.loc[real_idx, 'Sexo'] = new_sex
-                                        df.loc[real_idx, 'AñoNacimiento'] = new_year
-                                        df.loc[real_idx, 'Edad'] = datetime.now().year - new_year
-                                        
-                                        st.session_state.df = df
-                                        st.success("✅ Información actualizada")
+                                        if save_change(season_log, 'editar', swimmer_id, {
+                                            'Nombre': new_name,
+                                            'Disponible': new_available,
+                                            'Sexo': new_sex,
+                                            'AñoNacimiento': new_year,
+                                            'Edad': season_reference_year(current_sheet) - new_year
+                                        }):
+                                            st.success("✅ Información actualizada")
+                                        # Si otro usuario guardó antes, el conflicto aparece arriba
                                         st.rerun()
                                 
                                 with col_delete:
                                     if has_permission('delete'):
                                         if st.form_submit_button("🗑️ Eliminar", type="secondary"):
-                                            if st.session_state.get('confirm_delete_swimmer', '') == str(real_idx):
-                                                df_updated = df.drop(index=real_idx).reset_index(drop=True)
-                                                st.session_state.df = df_updated
-                                                st.success("✅ Nadador eliminado")
+                                            if st.session_state.get('confirm_delete_swimmer', '') == swimmer_id:
+                                                if save_change(season_log, 'eliminar', swimmer_id):
+                                                    st.success("✅ Nadador eliminado")
                                                 st.rerun()
                                             else:
-                                                st.session_state.confirm_delete_swimmer = str(real_idx)
+                                                st.session_state.confirm_delete_swimmer = swimmer_id
                                                 st.warning("⚠️ Haz clic otra vez para confirmar")
                         
                         with col2:
                             st.markdown("**⏱️ Gestión de Tiempos:**")
                             
-                            # Mostrar tiempos existentes
-                            swimmer_times = []
-                            for prueba in PRUEBAS:
-                                tiempo = swimmer.get(prueba, '')
-                                if pd.notna(tiempo) and str(tiempo).strip():
-                                    piscina = swimmer.get(f"{prueba}Piscina", '')
-                                    fecha = swimmer.get(f"{prueba}Fecha", '')
-                                    swimmer_times.append({
-                                        'Prueba': prueba,
-                                        'Tiempo': str(tiempo),
-                                        'Piscina': str(piscina),
-                                        'Fecha': str(fecha) if pd.notna(fecha) else ''
-                                    })
+                            # Mostrar tiempos existentes (precalculados por versión)
+                            swimmer_times = get_swimmer_detail(season_log, swimmer_id)
                             
-                            if swimmer_times:
-                                st.dataframe(pd.DataFrame(swimmer_times), use_container_width=True, height=200)
+                            if swimmer_times is not None:
+                                st.dataframe(swimmer_times, use_container_width=True, height=200)
                             else:
                                 st.info("No hay tiempos registrados")
                             
                             # Formulario para añadir tiempo
-                            with st.form(f"add_time_{real_idx}"):
+                            with st.form(f"add_time_{swimmer_id}"):
                                 st.markdown("**➕ Añadir Nuevo Tiempo:**")
                                 
                                 selected_event = st.selectbox("Prueba", PRUEBAS)
@@ -955,43 +3817,41 @@ def main():
                                         if valid:
                                             normalized_time = normalize_time(new_time)
                                             
-                                            df.loc[real_idx, selected_event] = normalized_time
-                                            df.loc[real_idx, f"{selected_event}Piscina"] = new_pool
-                                            df.loc[real_idx, f"{selected_event}Fecha"] = new_date
-                                            
-                                            st.session_state.df = df
-                                            st.success(f"✅ Tiempo guardado: {selected_event}")
+                                            if save_change(season_log, 'tiempo', swimmer_id, {
+                                                selected_event: normalized_time,
+                                                f"{selected_event}Piscina": new_pool,
+                                                f"{selected_event}Fecha": new_date
+                                            }):
+                                                st.success(f"✅ Tiempo guardado: {selected_event}")
                                             st.rerun()
                                         else:
                                             st.error("❌ Formato incorrecto")
                                     else:
                                         st.error("❌ El tiempo no puede estar vacío")
+                    
+                    # Versión de la fila que ve el usuario: los guardados del próximo rerun se comprueban contra ella
+                    remember_shown_row(season_log, swimmer_id)
             
             # Estadísticas de la temporada
             st.markdown("---")
             st.header("📊 Estadísticas de la Temporada")
             
+            stats = filtered['stats']
             col1, col2, col3, col4 = st.columns(4)
             
             with col1:
-                st.metric("👥 Total Nadadores", len(df_filtered))
+                st.metric("👥 Total Nadadores", stats['total'])
             
             with col2:
-                available_count = len(df_filtered[df_filtered['Disponible'] == True])
-                st.metric("✅ Disponibles", available_count)
+                st.metric("✅ Disponibles", stats['available'])
             
             with col3:
-                # Contar total de tiempos
-                total_times = 0
-                for prueba in PRUEBAS:
-                    if prueba in df_filtered.columns:
-                        total_times += df_filtered[prueba].notna().sum()
-                st.metric("⏱️ Tiempos Totales", total_times)
+                st.metric("⏱️ Tiempos Totales", stats['times'])
             
             with col4:
-                # Promedio de edad
-                avg_age = df_filtered.apply(lambda row: datetime.now().year - row.get('AñoNacimiento', 2000), axis=1).mean()
-                st.metric("🎂 Edad Promedio", f"{avg_age:.1f}")
+                st.metric("🎂 Edad Promedio", f"{stats['avg_age']:.1f}")
+            
+            show_category_summary(season_log)
         
         else:
             st.warning("No se encontraron nadadores con los filtros aplicados")
@@ -1001,16 +3861,12 @@ def main():
             st.markdown("---")
             st.header("📥 Descargar Datos")
             
-            output = io.BytesIO()
             try:
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    df.to_excel(writer, index=False, sheet_name=current_sheet)
-                
-                output.seek(0)
+                data = export_excel_bytes(df, current_sheet, (season_log.key, current_sheet))
                 
                 st.download_button(
                     label=f"📥 Descargar {current_sheet}",
-                    data=output.getvalue(),
+                    data=data,
                     file_name=f"nadadores_{current_sheet}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
                     mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                     type="primary"
@@ -1020,13 +3876,43 @@ def main():
                 st.error(f"Error al crear archivo: {str(e)}")
     
     # Pestaña 2: Conversión Masiva
+    profile_mark("gestión nadadores")
     with tabs[1]:
         show_mass_conversion()
+    profile_mark("conversión")
+    
+    # Pestaña 3: Progresión
+    with tabs[2]:
+        show_progression_dashboard(season_log)
+    profile_mark("progresión")
     
-    # Pestaña 3: Gestión de Usuarios (solo admin)
-    if has_permission('user_management') and len(tabs) > 2:
-        with tabs[2]:
+    # Pestaña 4: Optimizador de inscripciones
+    with tabs[3]:
+        show_meet_optimizer(season_log)
+    profile_mark("inscripciones")
+    
+    # Pestaña 5: Comparar y fusionar temporadas
+    with tabs[4]:
+        show_season_compare(season_log)
+    profile_mark("temporadas")
+    
+    # Pestaña 6: Informes
+    with tabs[5]:
+        show_reports(season_log)
+    profile_mark("informes")
+    
+    # Pestaña 7: Gestión de Usuarios (solo admin)
+    if has_permission('user_management') and len(tabs) > 6:
+        with tabs[6]:
             show_user_management()
+        profile_mark("usuarios")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+    
+    if '--benchmark' in sys.argv and get_script_run_ctx() is None:
+        run_benchmark(sys.argv[1:])
+    else:
+        main()
+        if PROFILE_ENABLED:
+            show_profile()
\ No newline at end of file